@@ -0,0 +1,24 @@
+from django.urls import path
+
+from .async_views import (download_shopping_cart, ingredient_detail,
+                          ingredient_list, recipe_detail, recipe_list,
+                          tag_detail, tag_list)
+
+
+urlpatterns = [
+    path('recipes/', recipe_list, name='recipes-list'),
+    path(
+        'recipes/download_shopping_cart/',
+        download_shopping_cart,
+        name='recipes-download-shopping-cart'
+    ),
+    path('recipes/<int:pk>/', recipe_detail, name='recipes-detail'),
+    path('ingredients/', ingredient_list, name='ingredients-list'),
+    path(
+        'ingredients/<int:pk>/',
+        ingredient_detail,
+        name='ingredients-detail'
+    ),
+    path('tags/', tag_list, name='tags-list'),
+    path('tags/<int:pk>/', tag_detail, name='tags-detail'),
+]
@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
+from foodgram.db import check_connections
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_VIEW_WORKERS,
+    thread_name_prefix='async-views'
+)
+
+
+class StreamLane:
+    """Поток чтения потоковых ответов и число ответов, читаемых в нём."""
+
+    def __init__(self, number):
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=f'async-stream-{number}'
+        )
+        self.streams = 0
+
+
+stream_lanes = [
+    StreamLane(number) for number in range(settings.ASYNC_STREAM_WORKERS)
+]
+
+
+def run_view(view, request, *args, **kwargs):
+    """Выполняет синхронное представление в потоке пула.
+
+    Потоковое содержимое отдаётся через async_streaming_content.
+    """
+    close_old_connections()
+    check_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        if response.streaming:
+            response.async_streaming_content = stream_content(
+                response.streaming_content
+            )
+            response.streaming_content = ()
+        return response
+    finally:
+        close_old_connections()
+
+
+def next_part(parts):
+    return next(parts, None)
+
+
+def close_parts(parts, last):
+    try:
+        if hasattr(parts, 'close'):
+            parts.close()
+    finally:
+        if last:
+            connection.close()
+
+
+async def stream_content(content):
+    """Части потокового ответа, прочитанные в одном потоке из пула."""
+    lane = min(stream_lanes, key=lambda lane: lane.streams)
+    lane.streams += 1
+    parts = iter(content)
+    read = sync_to_async(
+        next_part, thread_sensitive=False, executor=lane.executor
+    )
+    try:
+        while (part := await read(parts)) is not None:
+            yield part
+    finally:
+        lane.streams -= 1
+        await sync_to_async(
+            close_parts, thread_sensitive=False, executor=lane.executor
+        )(parts, lane.streams == 0)
+
+
+def async_view(view):
+    """Асинхронная обёртка над представлением DRF для ASGI."""
+    run = sync_to_async(run_view, thread_sensitive=False, executor=executor)
+
+    async def wrapper(request, *args, **kwargs):
+        return await run(view, request, *args, **kwargs)
+
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+def viewset_view(viewset, actions, basename, detail):
+    """Асинхронное представление viewset с параметрами, как у роутера."""
+    initkwargs = {'basename': basename, 'detail': detail}
+    for name in actions.values():
+        initkwargs.update(getattr(getattr(viewset, name), 'kwargs', {}))
+    if 'name' not in initkwargs:
+        initkwargs['suffix'] = 'Instance' if detail else 'List'
+    return async_view(viewset.as_view(actions, **initkwargs))
+
+
+recipe_list = viewset_view(
+    RecipeViewSet,
+    {'get': 'list', 'post': 'create'},
+    'recipes',
+    detail=False
+)
+recipe_detail = viewset_view(
+    RecipeViewSet,
+    {'get': 'retrieve', 'patch': 'partial_update', 'delete': 'destroy'},
+    'recipes',
+    detail=True
+)
+download_shopping_cart = viewset_view(
+    RecipeViewSet,
+    {'get': 'download_shopping_cart'},
+    'recipes',
+    detail=False
+)
+ingredient_list = viewset_view(
+    IngredientViewSet,
+    {'get': 'list'},
+    'ingredients',
+    detail=False
+)
+ingredient_detail = viewset_view(
+    IngredientViewSet,
+    {'get': 'retrieve'},
+    'ingredients',
+    detail=True
+)
+tag_list = viewset_view(TagViewSet, {'get': 'list'}, 'tags', detail=False)
+tag_detail = viewset_view(
+    TagViewSet,
+    {'get': 'retrieve'},
+    'tags',
+    detail=True
+)
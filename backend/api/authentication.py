@@ -0,0 +1,31 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.transaction import on_commit
+from rest_framework.authentication import TokenAuthentication
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кэшированием токена вместе с пользователем."""
+    cache_key = 'auth-token:{digest}'
+
+    @classmethod
+    def get_cache_key(cls, key):
+        return cls.cache_key.format(digest=sha256(key.encode()).hexdigest())
+
+    @classmethod
+    def invalidate_on_commit(cls, *keys):
+        on_commit(lambda: cache.delete_many([
+            cls.get_cache_key(key) for key in keys
+        ]))
+
+    def authenticate_credentials(self, key):
+        if not settings.CACHE_IS_SHARED:
+            return super().authenticate_credentials(key)
+        cache_key = self.get_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        return token.user, token
@@ -0,0 +1,179 @@
+from hashlib import sha1
+from time import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.transaction import on_commit
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+
+class ReferenceCache:
+    """Кэш JSON-ответов справочника по версии, сбрасываемой сигналами."""
+
+    def __init__(self, name):
+        self.version_key = f'reference:{name}:version'
+        self.value_key = f'reference:{name}:{{value}}:{{token}}'
+
+    def new_version(self):
+        return uuid4().hex, int(time())
+
+    def invalidate(self):
+        cache.set(self.version_key, self.new_version(), None)
+
+    def invalidate_on_commit(self):
+        on_commit(self.invalidate)
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            version = self.new_version()
+            if not cache.add(self.version_key, version, None):
+                version = cache.get(self.version_key, version)
+        return version
+
+    def get_value(self, name, build):
+        """Значение, построенное по текущей версии справочника."""
+        token, _ = self.get_version()
+        key = self.value_key.format(value=name, token=token)
+        value = cache.get(key)
+        if value is None:
+            value = build()
+            cache.set(key, value, settings.REFERENCE_CACHE_TIMEOUT)
+        return value
+
+    def get(self, render):
+        def build():
+            body = render()
+            return body, f'"{sha1(body).hexdigest()}"'
+
+        _, last_modified = self.get_version()
+        return (*self.get_value('body', build), last_modified)
+
+
+class ReferenceCacheMixin:
+    """Отдаёт список справочника из ReferenceCache с ETag и Last-Modified."""
+    reference_cache = None
+
+    def render_list(self):
+        serializer = self.get_serializer(self.get_queryset(), many=True)
+        return JSONRenderer().render(serializer.data)
+
+    def cached_list(self, request):
+        body, etag, last_modified = self.reference_cache.get(self.render_list)
+        response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified,
+            response=response
+        )
+
+
+class RecipeCache:
+    """Кэш не зависящей от пользователя части ответа о рецепте."""
+    key = 'recipe-detail:{pk}:{tags}:{ingredients}'
+    stats_key = 'recipe-detail:stats:{name}'
+    volatile_fields = (
+        'favorites_count',
+        'in_carts_count',
+        'is_favorited',
+        'is_in_shopping_cart'
+    )
+
+    def get_key(self, pk):
+        versions = cache.get_many(
+            (tags_cache.version_key, ingredients_cache.version_key)
+        )
+        tags_token, _ = (
+            versions.get(tags_cache.version_key) or tags_cache.get_version()
+        )
+        ingredients_token, _ = (
+            versions.get(ingredients_cache.version_key)
+            or ingredients_cache.get_version()
+        )
+        return self.key.format(
+            pk=pk,
+            tags=tags_token,
+            ingredients=ingredients_token
+        )
+
+    def count(self, name):
+        key = self.stats_key.format(name=name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, None)
+
+    def get(self, pk):
+        data = cache.get(self.get_key(pk))
+        self.count('hits' if data is not None else 'misses')
+        return data
+
+    def map_urls(self, data, function):
+        """Копия ответа с function, применённой к ссылкам на изображения."""
+        return {
+            **data,
+            'image': data['image'] and function(data['image']),
+            'image_variants': {
+                width: {
+                    extension: function(url)
+                    for extension, url in files.items()
+                }
+                for width, files in data['image_variants'].items()
+            }
+        }
+
+    def set(self, pk, data, request):
+        site = request.build_absolute_uri('/')
+        data = self.map_urls(data, lambda url: (
+            url[len(site) - 1:] if url.startswith(site) else url
+        ))
+        data = {
+            name: value for name, value in data.items()
+            if name not in self.volatile_fields
+        }
+        data['author'] = {
+            name: value for name, value in data['author'].items()
+            if name != 'is_subscribed'
+        }
+        cache.set(self.get_key(pk), data, settings.RECIPE_CACHE_TIMEOUT)
+
+    def merge(self, data, state, request):
+        """Ответ из кэшированной части и изменчивых полей рецепта."""
+        data = self.map_urls(data, request.build_absolute_uri)
+        data = {**data, 'author': {
+            **data['author'],
+            'is_subscribed': state['is_subscribed']
+        }}
+        for name in self.volatile_fields:
+            data[name] = state[name]
+        return data
+
+    def stats(self):
+        values = cache.get_many([
+            self.stats_key.format(name=name) for name in ('hits', 'misses')
+        ])
+        hits = values.get(self.stats_key.format(name='hits'), 0)
+        misses = values.get(self.stats_key.format(name='misses'), 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else None
+        }
+
+    def invalidate(self, *pks):
+        cache.delete_many([self.get_key(pk) for pk in pks])
+
+    def invalidate_on_commit(self, *pks):
+        on_commit(lambda: self.invalidate(*pks))
+
+
+tags_cache = ReferenceCache('tags')
+ingredients_cache = ReferenceCache('ingredients')
+recipe_cache = RecipeCache()
@@ -0,0 +1,36 @@
+from django.conf import settings
+from drf_base64.fields import Base64ImageField
+
+from api.images import load_image_token
+
+
+class RecipeImageField(Base64ImageField):
+    """Изображение рецепта: файл, строка base64 или токен загрузки."""
+    default_error_messages = {
+        'too_large': 'Размер изображения превышает {max_size} байт',
+        'too_many_pixels': 'Изображение больше {max_pixels} пикселей',
+        'invalid_token': 'Недействительный токен изображения',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('data:'):
+            if len(data) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+                self.fail(
+                    'too_large',
+                    max_size=settings.RECIPE_IMAGE_MAX_SIZE
+                )
+        elif isinstance(data, str) and not data.startswith('http'):
+            name = load_image_token(data, self.context['request'].user)
+            if name is None:
+                self.fail('invalid_token')
+            return name
+        file = super().to_internal_value(data)
+        if file.size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('too_large', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+        width, height = file.image.size
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail(
+                'too_many_pixels',
+                max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS
+            )
+        return file
@@ -1,38 +1,100 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Exists, F, OuterRef, Q
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe
+from api.cache import tags_cache
+from recipes.models import Cart, Favorite, Recipe, RecipeIngredient, Tag
+
+
+def get_tag_ids(slugs=()):
+    """Словарь {слаг: id} тегов; неизвестные кэшу слаги ищутся в базе."""
+    tag_ids = tags_cache.get_value(
+        'slugs',
+        lambda: dict(Tag.objects.values_list('slug', 'id'))
+    )
+    missing = set(slugs) - tag_ids.keys()
+    if missing:
+        found = dict(
+            Tag.objects.filter(slug__in=missing).values_list('slug', 'id')
+        )
+        if found:
+            tags_cache.invalidate()
+            tag_ids = {**tag_ids, **found}
+    return tag_ids
+
+
+def get_tag_choices(slugs=()):
+    return [(slug, slug) for slug in get_tag_ids(slugs)]
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug'
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='get_tags'
     )
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
         fields = (
             'author', 'tags',
             'is_favorited',
-            'is_in_shopping_cart'
+            'is_in_shopping_cart',
+            'search'
         )
 
+    def __init__(self, data=None, *args, **kwargs):
+        super().__init__(data, *args, **kwargs)
+        if data is not None and hasattr(data, 'getlist'):
+            slugs = data.getlist('tags')
+            self.filters['tags'].extra['choices'] = (
+                lambda: get_tag_choices(slugs)
+            )
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        tag_ids = get_tag_ids(value)
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=[tag_ids[slug] for slug in value]
+        )))
+
     def get_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=self.request.user,
+                recipe=OuterRef('pk')
+            )))
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(shopping_carts__user=self.request.user)
+            return queryset.filter(Exists(Cart.objects.filter(
+                user=self.request.user,
+                recipe=OuterRef('pk')
+            )))
         return queryset
 
-
-class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='istartswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+    def get_search(self, queryset, name, value):
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value)
+                | Q(text__icontains=value)
+                | Q(id__in=RecipeIngredient.objects.filter(
+                    ingredient__name__icontains=value
+                ).values('recipe'))
+            )
+        query = SearchQuery(
+            value,
+            config=settings.SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pub_date')
@@ -0,0 +1,174 @@
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.transaction import on_commit
+from PIL import Image, ImageOps
+
+from api.cache import recipe_cache
+from recipes.models import Recipe
+
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS,
+    thread_name_prefix='recipe-images'
+)
+
+TOKEN_SALT = 'recipe-image'
+
+VARIANT_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80},
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'optimize': True},
+}
+
+
+def strip_metadata(file):
+    """Удаляет из изображения EXIF, в том числе координаты GPS."""
+    file.seek(0)
+    with Image.open(file) as image:
+        if not image.getexif() and 'exif' not in image.info:
+            file.seek(0)
+            return file
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.info.pop('exif', None)
+        buffer = BytesIO()
+        image.save(
+            buffer,
+            format=image_format,
+            exif=b'',
+            **({'quality': 95} if image_format == 'JPEG' else {})
+        )
+    return ContentFile(buffer.getvalue(), name=file.name)
+
+
+def store_image(file):
+    """Сохраняет изображение без EXIF под именем из SHA-256 содержимого."""
+    file = strip_metadata(file)
+    digest = sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    name = str(PurePosixPath(
+        Recipe._meta.get_field('image').upload_to,
+        digest.hexdigest() + PurePosixPath(file.name).suffix.lower()
+    ))
+    if not default_storage.exists(name):
+        file.seek(0)
+        name = default_storage.save(name, file)
+    return name
+
+
+def make_image_token(name, user):
+    """Подписанный токен загруженного пользователем изображения."""
+    return signing.dumps({'name': name, 'user': user.id}, salt=TOKEN_SALT)
+
+
+def load_image_token(token, user):
+    """Имя файла из токена или None, если токен недействителен."""
+    try:
+        data = signing.loads(
+            token,
+            salt=TOKEN_SALT,
+            max_age=settings.RECIPE_IMAGE_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+    if data.get('user') != user.id:
+        return None
+    return data['name']
+
+
+def save_image(image, name, **options):
+    """Записывает изображение под именем name, заменяя файл целиком."""
+    buffer = BytesIO()
+    image.save(buffer, **options)
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        default_storage.delete(name)
+        default_storage.save(name, ContentFile(buffer.getvalue()))
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path), prefix='.', suffix='.tmp', delete=False
+    ) as file:
+        file.write(buffer.getvalue())
+    os.chmod(file.name, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+    os.replace(file.name, path)
+
+
+def get_variants(name):
+    """Имена уменьшенных копий изображения по ширине и формату."""
+    path = PurePosixPath(name)
+    return {
+        str(width): {
+            extension: str(
+                path.parent / 'variants' / path.stem / f'{width}.{extension}'
+            )
+            for extension in VARIANT_FORMATS
+        }
+        for width in settings.RECIPE_IMAGE_WIDTHS
+    }
+
+
+def get_missing_variants(variants):
+    return [
+        (int(width), extension, variant)
+        for width, files in variants.items()
+        for extension, variant in files.items()
+        if not default_storage.exists(variant)
+    ]
+
+
+def get_ready_variants(name):
+    """Копии изображения, если все они уже построены, иначе None."""
+    variants = get_variants(name)
+    if get_missing_variants(variants):
+        return None
+    return variants
+
+
+def build_variants(name):
+    """Строит недостающие уменьшенные копии изображения в WebP и JPEG."""
+    variants = get_variants(name)
+    missing = get_missing_variants(variants)
+    if missing:
+        with default_storage.open(name) as file, Image.open(file) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+            for width, extension, variant in missing:
+                options = VARIANT_FORMATS[extension]
+                thumbnail = image.copy()
+                thumbnail.thumbnail((width, width))
+                if options['format'] == 'JPEG':
+                    thumbnail = thumbnail.convert('RGB')
+                save_image(thumbnail, variant, **options)
+    recipes = Recipe.objects.filter(image=name)
+    recipes.update(image_variants=variants)
+    recipe_cache.invalidate(*recipes.values_list('id', flat=True))
+
+
+def process_image(name):
+    try:
+        build_variants(name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+    finally:
+        connection.close()
+
+
+def schedule_variants(name):
+    """Передаёт обработку изображения пулу после фиксации транзакции."""
+    on_commit(lambda: executor.submit(process_image, name))
@@ -0,0 +1,199 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.transaction import on_commit
+
+from recipes.models import Ingredient, RecipeIngredient
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для поиска по префиксу."""
+    version_key = 'ingredient_index_version'
+
+    def __init__(self):
+        self.state = (None, 0, (), ())
+
+    def invalidate(self):
+        cache.add(self.version_key, 0, None)
+        cache.incr(self.version_key)
+
+    def invalidate_on_commit(self):
+        on_commit(self.invalidate)
+
+    def build(self, version):
+        rows = sorted((
+            (name.casefold(), {
+                'id': ingredient_id,
+                'name': name,
+                'measurement_unit': measurement_unit
+            })
+            for ingredient_id, name, measurement_unit
+            in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        ), key=lambda row: (row[0], row[1]['id']))
+        self.state = (
+            version,
+            monotonic(),
+            tuple(key for key, _ in rows),
+            tuple(item for _, item in rows)
+        )
+        return self.state
+
+    def get_state(self):
+        version = cache.get(self.version_key, 0)
+        state = self.state
+        if (
+            state[0] != version
+            or monotonic() - state[1] > settings.REFERENCE_CACHE_TIMEOUT
+        ):
+            state = self.build(version)
+        return state
+
+    def search(self, name):
+        """Сначала ингредиенты, начинающиеся с name, затем содержащие его."""
+        _, _, keys, items = self.get_state()
+        prefix = name.casefold()
+        if not prefix:
+            return list(items)
+        start = bisect_left(keys, prefix)
+        end = bisect_right(keys, prefix + '\U0010ffff', start)
+        return [*items[start:end], *(
+            item for index, (key, item) in enumerate(zip(keys, items))
+            if (index < start or index >= end) and prefix in key
+        )]
+
+
+ingredient_index = IngredientIndex()
+
+
+class RecipeIngredientIndex:
+    """Инвертированный индекс ингредиент -> рецепты в памяти процесса.
+
+    Изменения доходят до других процессов через журнал в кэше.
+    """
+    version_key = 'recipe_ingredient_index_version'
+    change_key = 'recipe_ingredient_index_change:{version}'
+
+    def __init__(self):
+        self.version = None
+        self.built_at = 0
+        self.postings = {}
+        self.recipes = {}
+        self.lock = Lock()
+        self.build_lock = Lock()
+
+    def load(self):
+        postings, recipes = {}, {}
+        for ingredient_id, recipe_id in RecipeIngredient.objects.values_list(
+            'ingredient_id', 'recipe_id'
+        ).order_by('ingredient_id', 'recipe_id').iterator():
+            postings.setdefault(ingredient_id, array('q')).append(recipe_id)
+            recipes.setdefault(recipe_id, []).append(ingredient_id)
+        return postings, {
+            recipe_id: tuple(ingredient_ids)
+            for recipe_id, ingredient_ids in recipes.items()
+        }
+
+    def build(self, version):
+        """Перестраивает индекс из базы, если этого не делает другой поток."""
+        built_at = self.built_at
+        if not self.build_lock.acquire(blocking=self.version is None):
+            return
+        try:
+            if self.built_at != built_at:
+                return
+            postings, recipes = self.load()
+            with self.lock:
+                self.postings, self.recipes = postings, recipes
+                self.version = version
+                self.built_at = monotonic()
+        finally:
+            self.build_lock.release()
+
+    def is_outdated(self, version):
+        return (
+            self.version is None
+            or monotonic() - self.built_at > settings.RECIPE_INDEX_MAX_AGE
+            or not 0 <= version - self.version <= settings.RECIPE_INDEX_CHANGES
+        )
+
+    def ensure_current(self):
+        version = cache.get(self.version_key, 0)
+        if self.is_outdated(version):
+            self.build(version)
+            return
+        if self.version == version:
+            return
+        start = self.version
+        keys = [
+            self.change_key.format(version=number)
+            for number in range(start + 1, version + 1)
+        ]
+        changes = cache.get_many(keys)
+        applied = 0
+        with self.lock:
+            if self.version != start:
+                return
+            for key in keys:
+                if key not in changes:
+                    break
+                self.apply(*changes[key])
+                applied += 1
+            self.version += applied
+        if any(key in changes for key in keys[applied + 1:]):
+            # Запись журнала пропала, а более поздние есть.
+            self.build(version)
+
+    def apply(self, recipe_id, ingredient_ids):
+        for ingredient_id in self.recipes.pop(recipe_id, ()):
+            posting = self.postings[ingredient_id]
+            del posting[bisect_left(posting, recipe_id)]
+        if ingredient_ids:
+            self.recipes[recipe_id] = tuple(ingredient_ids)
+            for ingredient_id in ingredient_ids:
+                insort(
+                    self.postings.setdefault(ingredient_id, array('q')),
+                    recipe_id
+                )
+
+    def update_recipe(self, recipe_id, ingredient_ids):
+        """Заменяет ингредиенты рецепта в индексе после фиксации транзакции."""
+        def update():
+            change = (recipe_id, tuple(ingredient_ids))
+            cache.add(self.version_key, 0, None)
+            version = cache.incr(self.version_key)
+            cache.set(
+                self.change_key.format(version=version),
+                change,
+                settings.RECIPE_INDEX_MAX_AGE
+            )
+            with self.lock:
+                if self.version == version - 1:
+                    self.apply(*change)
+                    self.version = version
+
+        on_commit(update)
+
+    def match(self, ingredient_ids, max_missing):
+        """Рецепты, которым не хватает не больше max_missing ингредиентов."""
+        self.ensure_current()
+        with self.lock:
+            hits = Counter()
+            for ingredient_id in set(ingredient_ids):
+                hits.update(self.postings.get(ingredient_id, ()))
+            matches = []
+            for recipe_id, have in hits.items():
+                missing = len(self.recipes[recipe_id]) - have
+                if missing <= max_missing:
+                    matches.append((missing, -have, -recipe_id))
+        matches.sort()
+        return [-recipe_id for _, _, recipe_id in matches]
+
+
+recipe_index = RecipeIngredientIndex()
@@ -0,0 +1,294 @@
+import json
+import random
+from time import perf_counter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.http import QueryDict
+
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.filters import RecipeFilter
+from api.indexes import IngredientIndex, RecipeIngredientIndex
+from api.paginators import RecipeCursorPaginator
+from api.serializers import IngredientSerializer
+from api.views import RecipeViewSet
+from recipes.models import (Cart, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingListItem)
+from users.models import FoodgramUser
+
+BATCH_SIZE = 5000
+
+
+def percentile(values, rank):
+    index = min(len(values) - 1, int(len(values) * rank / 100))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеры задержки на синтетических данных: p50/p99 для каждого '
+        'сценария. Данные создаются в транзакции, которая откатывается'
+    )
+    scenarios = ('ingredients', 'cook', 'search', 'pages', 'shopping_list')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios',
+            nargs='*',
+            help=f'Сценарии из {", ".join(self.scenarios)}, по умолчанию все'
+        )
+        parser.add_argument(
+            '--size',
+            type=int,
+            help='Объём синтетических данных, по умолчанию свой у сценария'
+        )
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def measure(self, label, function, repeat=None):
+        timings = []
+        for _ in range(repeat or self.repeat):
+            started = perf_counter()
+            function()
+            timings.append(perf_counter() - started)
+        timings.sort()
+        self.stdout.write(
+            f'{label}: p50 {percentile(timings, 50) * 1000:.2f} мс, '
+            f'p99 {percentile(timings, 99) * 1000:.2f} мс'
+        )
+
+    def seed_ingredients(self, size=None):
+        with open(
+            f'{settings.BASE_DIR}/data/ingredients.json', encoding='utf-8'
+        ) as file:
+            ingredients = json.load(file)
+        size = size or len(ingredients)
+        Ingredient.objects.bulk_create((
+            Ingredient(
+                name=f'{ingredient["name"]} {number // len(ingredients)}',
+                measurement_unit=ingredient['measurement_unit']
+            )
+            for number, ingredient in zip(
+                range(size), ingredients * (size // len(ingredients) + 1)
+            )
+        ), batch_size=BATCH_SIZE)
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def seed_recipes(self, size, per_recipe=8, authors=100):
+        """size рецептов по per_recipe ингредиентов из 2000 справочных."""
+        FoodgramUser.objects.bulk_create(
+            FoodgramUser(
+                username=f'benchmark{number}',
+                email=f'benchmark{number}@example.com',
+                first_name='Автор',
+                last_name=str(number)
+            )
+            for number in range(authors)
+        )
+        author_ids = list(FoodgramUser.objects.filter(
+            username__startswith='benchmark'
+        ).values_list('id', flat=True))
+        ingredient_ids = self.seed_ingredients()[:2000]
+        Recipe.objects.bulk_create((
+            Recipe(
+                name=f'Рецепт {number}',
+                text=f'Описание рецепта {number}',
+                author_id=author_ids[number % len(author_ids)],
+                image='media/benchmark.png',
+                cooking_time=number % 120 + 1
+            )
+            for number in range(size)
+        ), batch_size=BATCH_SIZE)
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        weights = [1 / (rank + 1) for rank in range(len(ingredient_ids))]
+        RecipeIngredient.objects.bulk_create((
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=100
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in set(random.choices(
+                ingredient_ids, weights, k=per_recipe
+            ))
+        ), batch_size=BATCH_SIZE)
+        return recipe_ids, ingredient_ids
+
+    def benchmark_ingredients(self, size=None):
+        """Поиск ингредиента по началу названия: индекс и запрос к базе."""
+        size = len(self.seed_ingredients(size))
+        index = IngredientIndex()
+        index.get_state()
+        for name in ('с', 'мол', 'картофель'):
+            self.measure(
+                f'ingredients {size}, "{name}", индекс',
+                lambda: index.search(name)
+            )
+            self.measure(
+                f'ingredients {size}, "{name}", база',
+                lambda: IngredientSerializer(
+                    Ingredient.objects.filter(name__istartswith=name),
+                    many=True
+                ).data
+            )
+
+    def benchmark_cook(self, size=None):
+        """Подбор рецептов по имеющимся ингредиентам: индекс и GROUP BY."""
+        size = size or 100_000
+        recipe_ids, ingredient_ids = self.seed_recipes(size)
+        index = RecipeIngredientIndex()
+        version = cache.get(index.version_key, 0)
+        self.measure(
+            f'cook {size}, полная перестройка',
+            lambda: index.build(version),
+            repeat=3
+        )
+        for count in (5, 20, 50):
+            pantry = random.sample(ingredient_ids[:200], count)
+            for missing in (0, 2):
+                label = f'cook {size}, {count} ингредиентов, без {missing}'
+                self.measure(
+                    f'{label}, индекс',
+                    lambda: index.match(pantry, missing)
+                )
+                self.measure(
+                    f'{label}, база',
+                    lambda: list(RecipeIngredient.objects.values(
+                        'recipe'
+                    ).annotate(
+                        have=Count('id', filter=Q(ingredient__in=pantry)),
+                        total=Count('id')
+                    ).filter(
+                        have__gt=0,
+                        total__lte=F('have') + missing
+                    ).values_list('recipe', flat=True)),
+                    repeat=5
+                )
+        changes = iter(random.sample(recipe_ids, self.repeat))
+        self.measure(
+            f'cook {size}, применение изменения рецепта',
+            lambda: index.apply(
+                next(changes), random.sample(ingredient_ids, 8)
+            )
+        )
+
+    def benchmark_search(self, size=None):
+        """Поиск рецептов: фильтр search и прежний поиск по icontains."""
+        size = size or 100_000
+        self.seed_recipes(size)
+        Recipe.objects.update_search_vector()
+        for text in ('сахар', 'молоко', f'Рецепт {size - 1}'):
+            label = f'search {size}, "{text}"'
+            self.measure(
+                f'{label}, фильтр search',
+                lambda: list(RecipeFilter(
+                    QueryDict(urlencode({'search': text})),
+                    Recipe.objects.defer('search_vector')
+                ).qs[:settings.PAGE_SIZE])
+            )
+            self.measure(
+                f'{label}, icontains',
+                lambda: list(Recipe.objects.defer('search_vector').filter(
+                    Q(name__icontains=text)
+                    | Q(text__icontains=text)
+                    | Q(id__in=RecipeIngredient.objects.filter(
+                        ingredient__name__icontains=text
+                    ).values('recipe'))
+                )[:settings.PAGE_SIZE]),
+                repeat=5
+            )
+
+    def benchmark_pages(self, size=None):
+        """Глубокая страница списка рецептов: номер страницы и курсор."""
+        size = size or 100_000
+        self.seed_recipes(size, per_recipe=3)
+        view = RecipeViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+        limit = settings.PAGE_SIZE
+        for page in (1, 50, 500):
+            if page * limit > size:
+                continue
+            url = f'/api/recipes/?limit={limit}&page={page}'
+            self.measure(
+                f'pages {size}, страница {page}, номер',
+                lambda: view(factory.get(url)).render()
+            )
+            url = f'/api/recipes/?limit={limit}&pagination=cursor'
+            if page > 1:
+                last = Recipe.objects.order_by(
+                    *RecipeCursorPaginator.ordering
+                ).values_list('pub_date', 'id')[(page - 1) * limit - 1]
+                paginator = RecipeCursorPaginator()
+                paginator.base_url = f'http://testserver{url}'
+                url = paginator.encode_position(*last)
+            self.measure(
+                f'pages {size}, страница {page}, курсор',
+                lambda: view(factory.get(url)).render()
+            )
+
+    def benchmark_shopping_list(self, size=None):
+        """Список покупок по size рецептам: готовые итоги и GROUP BY."""
+        size = size or 1000
+        recipe_ids, _ = self.seed_recipes(size)
+        user = FoodgramUser.objects.get(username='benchmark0')
+        Cart.objects.bulk_create(
+            (Cart(user=user, recipe_id=recipe_id) for recipe_id in recipe_ids),
+            batch_size=BATCH_SIZE
+        )
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user=user,
+                    ingredient_id=ingredient_id,
+                    amount=amount
+                )
+                for ingredient_id, amount in RecipeIngredient.objects.values(
+                    'ingredient'
+                ).annotate(total=Sum('amount')).values_list(
+                    'ingredient', 'total'
+                )
+            ),
+            batch_size=BATCH_SIZE
+        )
+        view = RecipeViewSet.as_view(
+            {'get': 'download_shopping_cart'},
+            **RecipeViewSet.download_shopping_cart.kwargs
+        )
+        factory = APIRequestFactory()
+
+        def download(format):
+            request = factory.get(
+                f'/api/recipes/download_shopping_cart/?format={format}'
+            )
+            force_authenticate(request, user)
+            return b''.join(view(request).streaming_content)
+
+        for format in ('txt', 'csv', 'json'):
+            self.measure(
+                f'shopping_list {size}, {format}',
+                lambda: download(format)
+            )
+        self.measure(
+            f'shopping_list {size}, GROUP BY по корзине',
+            lambda: list(RecipeIngredient.objects.filter(
+                recipe__shopping_carts__user=user
+            ).values(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).annotate(
+                total=Sum('amount')
+            ).order_by('ingredient__name'))
+        )
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        unknown = set(options['scenarios']) - set(self.scenarios)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(unknown)}')
+        for name in options['scenarios'] or self.scenarios:
+            with transaction.atomic():
+                getattr(self, f'benchmark_{name}')(options['size'])
+                transaction.set_rollback(True)
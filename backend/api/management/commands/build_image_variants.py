@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.images import build_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии изображений рецептов, у которых их нет'
+
+    def handle(self, *args, **options):
+        names = list(Recipe.objects.filter(
+            image_variants={}
+        ).values_list('image', flat=True).order_by().distinct())
+        for name in names:
+            build_variants(name)
+        self.stdout.write(f'Обработано изображений: {len(names)}')
@@ -0,0 +1,110 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, time
+
+import requests
+from django.core.management.base import BaseCommand
+
+
+def percentile(values, rank):
+    if not values:
+        return None
+    index = min(len(values) - 1, int(len(values) * rank / 100))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест запущенного сервера: запросы в секунду '
+        'и задержки p50/p99 по каждому адресу'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://localhost:8000',
+            help='Адрес сервера'
+        )
+        parser.add_argument(
+            '--path',
+            action='append',
+            dest='paths',
+            help='Адрес для проверки, можно указать несколько раз'
+        )
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10,
+            help='Длительность проверки каждого адреса, секунд'
+        )
+        parser.add_argument('--token', help='Токен авторизации')
+        parser.add_argument(
+            '--label',
+            default='',
+            help='Название конфигурации сервера для отчёта'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл, в который дописываются результаты в формате JSON'
+        )
+
+    def run(self, url, options):
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        deadline = perf_counter() + options['duration']
+        local = threading.local()
+        latencies, errors = [], []
+
+        def worker():
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            while perf_counter() < deadline:
+                started = perf_counter()
+                try:
+                    ok = local.session.get(url, headers=headers).ok
+                except requests.RequestException:
+                    ok = False
+                latencies.append(perf_counter() - started)
+                if not ok:
+                    errors.append(1)
+
+        started = perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            for _ in range(options['concurrency']):
+                pool.submit(worker)
+        elapsed = perf_counter() - started
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        }
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or (
+            '/api/recipes/', '/api/ingredients/', '/api/tags/'
+        )
+        results = []
+        for path in paths:
+            result = {
+                'label': options['label'],
+                'path': path,
+                'concurrency': options['concurrency'],
+                'timestamp': int(time()),
+                **self.run(options['url'].rstrip('/') + path, options)
+            }
+            results.append(result)
+            self.stdout.write(
+                f'{path}: {result["rps"]} запросов/с, '
+                f'p50 {result["p50_ms"]} мс, p99 {result["p99_ms"]} мс, '
+                f'ошибок {result["errors"]} из {result["requests"]}'
+            )
+        if options['output']:
+            with open(options['output'], 'a', encoding='utf-8') as file:
+                for result in results:
+                    file.write(json.dumps(result, ensure_ascii=False) + '\n')
@@ -1,15 +1,35 @@
-from users.models import Subscribe
-
-
 class SubscriptionMixin:
 
+    def get_subscriptions(self, user):
+        """Идентификаторы авторов, на которых подписан пользователь."""
+        if 'subscriptions' not in self.context:
+            self.context['subscriptions'] = set(
+                user.follower.values_list('author_id', flat=True)
+            )
+        return self.context['subscriptions']
+
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
         return (
             request
             and request.user.is_authenticated
-            and Subscribe.objects.filter(
-                user=request.user,
-                author=obj
-            ).exists()
+            and obj.id in self.get_subscriptions(request.user)
         )
+
+
+class ImageVariantsMixin:
+
+    def get_image_variants(self, obj):
+        """Ссылки на уменьшенные копии изображения по ширине и формату."""
+        request = self.context.get('request')
+        storage = obj.image.storage
+        return {
+            width: {
+                extension: (
+                    request.build_absolute_uri(storage.url(name))
+                    if request else storage.url(name)
+                )
+                for extension, name in files.items()
+            }
+            for width, files in obj.image_variants.items()
+        }
@@ -1,7 +1,276 @@
+import heapq
+from collections import OrderedDict
+from functools import partial
+from hashlib import sha1
+
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+
+
+class RowsPage(Page):
+    """Страница, знающая о следующей по лишней прочитанной строке."""
+
+    def __init__(self, object_list, number, paginator, has_next_rows):
+        super().__init__(object_list, number, paginator)
+        self.has_next_rows = has_next_rows
+
+    def has_next(self):
+        return self.has_next_rows
+
+
+class CountCachingPaginator(Paginator):
+    """Paginator с кэшированным или оценочным количеством объектов."""
+
+    def __init__(self, *args, timeout, estimate_threshold, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeout = timeout
+        self.estimate_threshold = estimate_threshold
+        self.count_exact = True
+
+    def estimate_count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if (
+            connection.vendor != 'postgresql'
+            or queryset.query.where
+            or queryset.query.distinct
+        ):
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                (queryset.model._meta.db_table, )
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < self.estimate_threshold:
+            return None
+        return int(row[0])
+
+    @cached_property
+    def count(self):
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+        except (AttributeError, EmptyResultSet):
+            return super().count
+        key = 'page-count:' + sha1(f'{sql}{params}'.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = self.estimate_count()
+            if count is None:
+                count = super().count
+            else:
+                self.count_exact = False
+            cache.set(key, count, self.timeout)
+        else:
+            self.count_exact = False
+        return count
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return super().validate_number(number)
+        if number < 1:
+            return super().validate_number(number)
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('Страница не содержит результатов')
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not has_next:
+            self.count = bottom + len(rows)
+            self.count_exact = True
+        elif self.count <= bottom + len(rows):
+            self.count = bottom + len(rows) + 1
+            self.count_exact = False
+        return RowsPage(rows, number, self, has_next)
 
 
 class PageNumberLimitPaginator(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = settings.PAGE_SIZE
+    count_cache_timeout = None
+
+    # Параметры, делающие выборку зависимой от пользователя: количество
+    # для них не кэшируется, иначе оно отставало бы от его же действий.
+    viewer_params = ()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        return super().paginate_queryset(queryset, request, view)
+
+    @property
+    def django_paginator_class(self):
+        if not self.count_cache_timeout or any(
+            param in self.request.query_params for param in self.viewer_params
+        ):
+            return Paginator
+        return partial(
+            CountCachingPaginator,
+            timeout=self.count_cache_timeout,
+            estimate_threshold=settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD
+        )
+
+    def get_paginated_response(self, data):
+        paginator = self.page.paginator
+        return Response(OrderedDict([
+            ('count', paginator.count),
+            ('count_exact', getattr(paginator, 'count_exact', True)),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class CachedCountPaginator(PageNumberLimitPaginator):
+    count_cache_timeout = settings.PAGINATION_COUNT_CACHE_TIMEOUT
+
+
+class RecipeCursorPaginator(CursorPagination):
+    """Постраничный вывод рецептов по ключу (pub_date, id)."""
+    ordering = ('-pub_date', '-id')
+    page_size_query_param = 'limit'
+    page_size = settings.PAGE_SIZE
+    # Параметры со своим порядком выдачи: курсор по (pub_date, id)
+    # молча отбросил бы его.
+    ordered_params = ('ordering', 'search')
+
+    def check_params(self, request):
+        for param in self.ordered_params:
+            if param in request.query_params:
+                raise ValidationError({param: [
+                    'Параметр не поддерживается при постраничном выводе '
+                    'по курсору'
+                ]})
+
+    def decode_position(self, request):
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            return None
+        pub_date, _, pk = (cursor.position or '').partition('|')
+        try:
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except ValueError:
+            pub_date = None
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.check_params(request)
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        position = self.decode_position(request)
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            pub_date, pk = position
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+            )
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        self.has_next = len(results) > self.page_size
+        return self.page
+
+    def encode_position(self, pub_date, pk):
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=False,
+            position=f'{pub_date.isoformat()}|{pk}'
+        ))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        return self.encode_position(last.pub_date, last.id)
+
+    def get_previous_link(self):
+        return None
+
+
+class FeedCursorPaginator(RecipeCursorPaginator):
+    """Курсор по ленте, собранной из нескольких querysets ключей."""
+
+    def get_keys(self, queryset, pk_field, position):
+        if position is not None:
+            pub_date, pk = position
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, **{f'{pk_field}__lt': pk})
+            )
+        return queryset.order_by('-pub_date', f'-{pk_field}').values_list(
+            'pub_date', pk_field
+        )[:self.page_size + 1]
+
+    def paginate_queryset(self, sources, request, view=None):
+        self.check_params(request)
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        position = self.decode_position(request)
+        keys = []
+        for key in heapq.merge(
+            *(
+                self.get_keys(queryset, pk_field, position)
+                for queryset, pk_field in sources
+            ),
+            reverse=True
+        ):
+            if keys and keys[-1] == key:
+                continue
+            keys.append(key)
+            if len(keys) > self.page_size:
+                break
+        self.keys = keys[:self.page_size]
+        self.has_next = len(keys) > self.page_size
+        self.page = [pk for _, pk in self.keys]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_position(*self.keys[-1])
+
+
+class RecipePaginator(CachedCountPaginator):
+    """Номерные страницы или курсор при pagination=cursor."""
+    cursor_paginator_class = RecipeCursorPaginator
+    viewer_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (
+            'cursor' in request.query_params
+            or request.query_params.get('pagination') == 'cursor'
+        ):
+            self.cursor_paginator = self.cursor_paginator_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
@@ -0,0 +1,82 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок, по умолчанию текстовый."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def header(self):
+        return ''
+
+    def format_row(self, number, name, measurement_unit, total):
+        return f'{name} - {total} {measurement_unit}\n'
+
+    def footer(self, count):
+        return ''
+
+    def stream(self, items):
+        header = self.header()
+        if header:
+            yield header
+        count = 0
+        for count, item in enumerate(items, 1):
+            yield self.format_row(count, *item)
+        footer = self.footer(count)
+        if footer:
+            yield footer
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    """Строки вида «ингредиент - количество единица»."""
+
+
+class Echo:
+    """Псевдобуфер, возвращающий записанную строку для csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def __init__(self):
+        self.writer = csv.writer(Echo())
+
+    def header(self):
+        return self.writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        )
+
+    def format_row(self, number, name, measurement_unit, total):
+        return self.writer.writerow((name, total, measurement_unit))
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def header(self):
+        return '['
+
+    def format_row(self, number, name, measurement_unit, total):
+        return (',' if number > 1 else '') + json.dumps(
+            {
+                'name': name,
+                'amount': total,
+                'measurement_unit': measurement_unit
+            },
+            ensure_ascii=False
+        )
+
+    def footer(self, count):
+        return ']'
@@ -1,17 +1,23 @@
+import logging
+
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch, prefetch_related_objects
 from django.db.transaction import atomic
 from djoser.serializers import UserCreateSerializer
-from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 
-from api.mixins import SubscriptionMixin
+from api.fields import RecipeImageField
+from api.images import get_ready_variants, schedule_variants, store_image
+from api.indexes import recipe_index
+from api.mixins import ImageVariantsMixin, SubscriptionMixin
 from recipes.models import (Cart, Favorite, Ingredient, Recipe,
-                            RecipeIngredient, Tag)
-from users.models import Subscribe
+                            RecipeIngredient, ShoppingListItem, Tag)
 
 
 FoodgramUser = get_user_model()
 
+logger = logging.getLogger(__name__)
+
 
 class UserGetSerializer(SubscriptionMixin, UserCreateSerializer):
     is_subscribed = serializers.SerializerMethodField()
@@ -28,7 +34,11 @@ class UserGetSerializer(SubscriptionMixin, UserCreateSerializer):
         model = FoodgramUser
 
 
-class RecipeSimpleSerializer(serializers.ModelSerializer):
+class RecipeSimpleSerializer(
+    ImageVariantsMixin,
+    serializers.ModelSerializer
+):
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -36,6 +46,7 @@ class RecipeSimpleSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
 
@@ -59,83 +70,47 @@ class SubscriptionsSerializer(SubscriptionMixin, serializers.ModelSerializer):
         )
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        recipes = getattr(obj, 'recipes_preview', None)
+        if recipes is None:
+            limit_serializer = RecipesLimitSerializer(
+                data=self.context['request'].query_params
+            )
+            limit_serializer.is_valid(raise_exception=True)
+            limit = limit_serializer.validated_data.get('recipes_limit')
+            recipes = obj.recipes.all()
+            if limit:
+                recipes = recipes[:limit]
         serializer = RecipeSimpleSerializer(
             recipes, many=True, read_only=True)
         return serializer.data
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        fields = '__all__'
-        model = Subscribe
-        validators = (
-            serializers.UniqueTogetherValidator(
-                queryset=Subscribe.objects.all(),
-                fields=('user', 'author'),
-                message='Вы уже подписаны на этого автора!'
-            ),
-        )
-
-    def validate_author(self, author):
-        if self.context['request'].user == author:
-            raise serializers.ValidationError(
-                'Невозможно подписаться на самого себя')
-        return author
-
-    def to_representation(self, instance):
-        return SubscriptionsSerializer(
-            instance.author,
-            context=self.context
-        ).data
-
-
-class FavoriteSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        fields = ('user', 'recipe')
-        model = Favorite
-        validators = (
-            serializers.UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже в избранном'
-            ),
-        )
-
-    def to_representation(self, instance):
-        return RecipeSimpleSerializer(
-            instance.recipe,
-            context=self.context
-        ).data
+class CookSerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False
+    )
+    missing = serializers.IntegerField(
+        min_value=0,
+        max_value=10,
+        default=0
+    )
 
 
-class CartSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(serializers.Serializer):
+    image = RecipeImageField(write_only=True)
 
-    class Meta:
-        fields = ('user', 'recipe')
-        model = Cart
-        validators = [
-            serializers.UniqueTogetherValidator(
-                queryset=Cart.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже в корзине'
-            )
-        ]
 
-    def to_representation(self, instance):
-        return RecipeSimpleSerializer(
-            instance.recipe,
-            context=self.context
-        ).data
+class RecipesLimitSerializer(serializers.Serializer):
+    recipes_limit = serializers.IntegerField(
+        min_value=1,
+        required=False
+    )
 
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
@@ -161,7 +136,7 @@ class TagSerializer(serializers.ModelSerializer):
         model = Tag
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     author = UserGetSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = IngredientInRecipeSerializer(
@@ -171,12 +146,15 @@ class RecipeListSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date', )
+        exclude = ('pub_date', 'search_vector')
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return (
             request
@@ -188,6 +166,8 @@ class RecipeListSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (
             request
@@ -207,9 +187,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-    )
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(
         max_value=32767,
         min_value=1
@@ -221,26 +199,43 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = RecipeImageField()
     ingredients = RecipeIngredientCreateSerializer(many=True)
     cooking_time = serializers.IntegerField(
         min_value=1,
         max_value=32767
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
+    tags = serializers.ListField(
+        child=serializers.IntegerField()
     )
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date', 'author')
+        exclude = (
+            'pub_date', 'author', 'favorites_count', 'in_carts_count',
+            'search_vector', 'image_variants'
+        )
+
+    def store_image(self, validated_data):
+        """Сохраняет загруженное изображение и ставит в очередь его копии."""
+        if 'image' not in validated_data:
+            return
+        name = validated_data['image']
+        variants = None
+        if isinstance(name, str):
+            variants = get_ready_variants(name)
+        else:
+            name = store_image(name)
+        validated_data['image'] = name
+        validated_data['image_variants'] = variants or {}
+        if variants is None:
+            schedule_variants(name)
 
     def create_ingredients(self, recipe, ingredients):
         RecipeIngredient.objects.bulk_create([
             RecipeIngredient(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(id=ingredient['id'].id),
+                ingredient=ingredient['id'],
                 amount=ingredient['amount']
             ) for ingredient in ingredients
         ])
@@ -249,22 +244,92 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
+        self.store_image(validated_data)
         recipe = Recipe.objects.create(
             author=self.context['request'].user,
             **validated_data
         )
         self.create_ingredients(recipe, ingredients)
         recipe.tags.set(tags)
+        recipe_index.update_recipe(
+            recipe.id,
+            [ingredient['id'].id for ingredient in ingredients]
+        )
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Приводит ингредиенты рецепта к ingredients по разнице."""
+        amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current, old_amounts, deleted = {}, {}, []
+        for item in recipe.recipes.all():
+            old_amounts[item.ingredient_id] = (
+                old_amounts.get(item.ingredient_id, 0) + item.amount
+            )
+            if item.ingredient_id in current or (
+                item.ingredient_id not in amounts
+            ):
+                deleted.append(item.id)
+            else:
+                current[item.ingredient_id] = item
+        created = [
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        updated = []
+        for ingredient_id, item in current.items():
+            if item.amount != amounts[ingredient_id]:
+                item.amount = amounts[ingredient_id]
+                updated.append(item)
+        RecipeIngredient.objects.bulk_create(created)
+        RecipeIngredient.objects.bulk_update(updated, ('amount', ))
+        RecipeIngredient.objects.filter(id__in=deleted).delete()
+        if old_amounts != amounts:
+            ShoppingListItem.objects.update_recipe(
+                recipe.id,
+                old_amounts,
+                amounts
+            )
+        return len(created) + len(updated) + len(deleted)
+
     @atomic
     def update(self, recipe, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        recipe.ingredients.clear()
-        self.create_ingredients(recipe, ingredients)
-        recipe.tags.set(tags)
-        return super().update(recipe, validated_data)
+        self.store_image(validated_data)
+        touched = self.update_ingredients(recipe, ingredients)
+        if touched:
+            recipe_index.update_recipe(
+                recipe.id,
+                [ingredient['id'].id for ingredient in ingredients]
+            )
+        tags_changed = (
+            set(recipe.tags.values_list('id', flat=True))
+            != {tag.id for tag in tags}
+        )
+        if tags_changed:
+            recipe.tags.set(tags)
+        logger.info(
+            'Рецепт %s обновлён: затронуто строк ингредиентов - %s, '
+            'теги изменены - %s',
+            recipe.id, touched, tags_changed
+        )
+        # Счётчики и копии изображения меняются в обход сериализатора,
+        # сохранение прочитанных ранее значений затёрло бы эти изменения.
+        for name, value in validated_data.items():
+            setattr(recipe, name, value)
+        recipe.save(update_fields={
+            field.name for field in Recipe._meta.concrete_fields
+            if not field.primary_key and field.name not in self.Meta.exclude
+        } | set(validated_data))
+        return recipe
 
     def validate(self, data):
         ingredients = data.get('ingredients')
@@ -277,19 +342,37 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'В рецепте не могут отсутствовать теги'
             )
-        validated_ingredients = []
-        for ingredient in ingredients:
-            if ingredient not in validated_ingredients:
-                validated_ingredients.append(ingredient)
-            else:
-                raise serializers.ValidationError(
-                    'Ингредиенты не могут дублироваться'
-                )
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты не могут дублироваться'
+            )
         if len(tags) != len(set(tags)):
             raise serializers.ValidationError(
                 'Теги не могут дублироваться'
             )
+        found_ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+        if len(found_ingredients) != len(ingredient_ids):
+            raise serializers.ValidationError(
+                'Указан несуществующий ингредиент'
+            )
+        found_tags = Tag.objects.in_bulk(tags)
+        if len(found_tags) != len(tags):
+            raise serializers.ValidationError(
+                'Указан несуществующий тег'
+            )
+        for ingredient in ingredients:
+            ingredient['id'] = found_ingredients[ingredient['id']]
+        data['tags'] = [found_tags[tag_id] for tag_id in tags]
         return data
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            (instance, ),
+            'tags',
+            Prefetch(
+                'recipes',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
         return RecipeListSerializer(instance, context=self.context).data
@@ -0,0 +1,109 @@
+from threading import local
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.db.transaction import on_commit
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import CachedTokenAuthentication
+from api.cache import ingredients_cache, recipe_cache, tags_cache
+from api.indexes import ingredient_index, recipe_index
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.signals import reference_data_loaded
+
+pending_search_vectors = local()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(reference_data_loaded, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    ingredient_index.invalidate_on_commit()
+    ingredients_cache.invalidate_on_commit()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(reference_data_loaded, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    tags_cache.invalidate_on_commit()
+
+
+@receiver(post_save, sender=Ingredient)
+def update_recipes_search_vector(sender, instance, created, **kwargs):
+    if not created:
+        Recipe.objects.filter(ingredients=instance).update_search_vector()
+
+
+def update_pending_search_vectors():
+    recipe_ids = getattr(pending_search_vectors, 'recipe_ids', None)
+    if recipe_ids:
+        pending_search_vectors.recipe_ids = set()
+        Recipe.objects.filter(pk__in=recipe_ids).update_search_vector()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def update_recipe_search_vector(sender, instance, **kwargs):
+    """Пересчитывает вектор рецепта после фиксации транзакции."""
+    if not hasattr(pending_search_vectors, 'recipe_ids'):
+        pending_search_vectors.recipe_ids = set()
+    pending_search_vectors.recipe_ids.add(
+        instance.id if sender is Recipe else instance.recipe_id
+    )
+    on_commit(update_pending_search_vectors)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_index(sender, instance, **kwargs):
+    recipe_index.update_recipe(instance.id, ())
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    recipe_cache.invalidate_on_commit(instance.id)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    recipe_cache.invalidate_on_commit(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        recipe_cache.invalidate_on_commit(instance.id)
+    elif pk_set:
+        recipe_cache.invalidate_on_commit(*pk_set)
+    else:
+        recipe_cache.invalidate_on_commit(
+            *instance.recipe.values_list('id', flat=True)
+        )
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_author_recipes(sender, instance, created, **kwargs):
+    if not created:
+        recipe_cache.invalidate_on_commit(
+            *instance.recipes.values_list('id', flat=True)
+        )
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    CachedTokenAuthentication.invalidate_on_commit(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        CachedTokenAuthentication.invalidate_on_commit(
+            *Token.objects.filter(user=instance).values_list('key', flat=True)
+        )
@@ -0,0 +1,962 @@
+import asyncio
+import base64
+import io
+import json
+import logging
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from time import perf_counter, sleep
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import F
+from django.http import HttpResponse, QueryDict
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.async_views import stream_lanes
+from api.filters import RecipeFilter
+from api.images import build_variants, save_image, store_image
+from api.serializers import RecipeCreateSerializer
+from api.indexes import RecipeIngredientIndex
+from foodgram.db import ReplicaMiddleware, ReplicaRouter, request_replica
+from foodgram.handlers import StreamingASGIHandler
+from foodgram.middleware import AsgiUrlconfMiddleware
+from recipes.models import (Cart, Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingListItem, Tag)
+from users.models import FoodgramUser, Subscribe
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+# Реплики для проверки маршрутизации - отдельные базы SQLite в памяти.
+# Миграции на реплики не применяются, поэтому чтение с них завершается
+# OperationalError, как при отказе реплики.
+REPLICAS = ('replica_test_1', 'replica_test_2')
+for alias in REPLICAS:
+    connections.settings.setdefault(alias, {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    })
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeAPITestCase(TestCase):
+    """Общие данные: два пользователя, теги, ингредиенты и рецепты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = FoodgramUser.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Автор',
+            last_name='Рецептов',
+            password='Pass-12345'
+        )
+        cls.reader = FoodgramUser.objects.create_user(
+            email='reader@example.com',
+            username='reader',
+            first_name='Читатель',
+            last_name='Рецептов',
+            password='Pass-12345'
+        )
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', slug=f'tag{number}',
+                color=f'#00000{number}')
+            for number in range(3)
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number:02}', measurement_unit='г')
+            for number in range(40)
+        )
+        cls.tags = list(Tag.objects.order_by('id'))
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        cls.image = make_image()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = self.get_client(self.author)
+        self.reader_client = self.get_client(self.reader)
+        self.anonymous_client = APIClient()
+
+    def get_client(self, user):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}'
+        )
+        return client
+
+    def recipe_payload(self, ingredients=2, offset=0, **fields):
+        return {
+            'name': 'Борщ',
+            'text': 'Свёкла и капуста',
+            'cooking_time': 30,
+            'image': self.image,
+            'tags': [tag.id for tag in self.tags[:2]],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10 + number}
+                for number, ingredient
+                in enumerate(
+                    self.ingredients[offset:offset + ingredients]
+                )
+            ],
+            **fields
+        }
+
+    def create_recipes(self, count, ingredients=3):
+        ids = []
+        for _ in range(count):
+            response = self.author_client.post(
+                '/api/recipes/',
+                self.recipe_payload(ingredients),
+                format='json'
+            )
+            self.assertEqual(response.status_code, 201, response.data)
+            ids.append(response.data['id'])
+        return ids
+
+
+class RecipeQueryCountTest(RecipeAPITestCase):
+    """Число запросов к базе не зависит от числа рецептов на странице."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe_ids = self.create_recipes(12)
+        for recipe_id in self.recipe_ids[::2]:
+            Favorite.objects.create(user=self.reader, recipe_id=recipe_id)
+            Cart.objects.create(user=self.reader, recipe_id=recipe_id)
+        cache.clear()
+
+    def test_list_anonymous(self):
+        for limit in (2, 11):
+            cache.clear()
+            with self.subTest(limit=limit), self.assertNumQueries(4):
+                response = self.anonymous_client.get(
+                    f'/api/recipes/?limit={limit}'
+                )
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_flags_are_annotated(self):
+        for limit in (2, 11):
+            cache.clear()
+            with self.subTest(limit=limit), self.assertNumQueries(6):
+                response = self.reader_client.get(
+                    f'/api/recipes/?limit={limit}'
+                )
+            self.assertEqual(len(response.data['results']), limit)
+            for recipe in response.data['results']:
+                expected = recipe['id'] in self.recipe_ids[::2]
+                self.assertIs(recipe['is_favorited'], expected)
+                self.assertIs(recipe['is_in_shopping_cart'], expected)
+
+    def test_retrieve_flags_are_annotated(self):
+        with self.assertNumQueries(5):
+            response = self.reader_client.get(
+                f'/api/recipes/{self.recipe_ids[0]}/'
+            )
+        self.assertIs(response.data['is_favorited'], True)
+        self.assertIs(response.data['is_in_shopping_cart'], True)
+
+    def test_list_query_count_does_not_depend_on_limit(self):
+        self.create_recipes(3, ingredients=30)
+        counts = set()
+        for limit in (1, 6, 14):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.anonymous_client.get(
+                    f'/api/recipes/?limit={limit}'
+                )
+            self.assertEqual(len(response.data['results']), limit)
+            counts.add(len(queries))
+        self.assertEqual(counts, {4})
+
+    def test_last_page_is_counted_without_count_query(self):
+        with self.assertNumQueries(3):
+            response = self.anonymous_client.get('/api/recipes/?limit=100')
+        self.assertEqual(response.data['count'], 12)
+        self.assertIs(response.data['count_exact'], True)
+
+
+class RecipeWriteQueryCountTest(RecipeAPITestCase):
+    """Создание и изменение рецепта не делают запрос на каждый ингредиент."""
+
+    def count_queries(self, method, url, payload):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.author_client, method)(
+                url, payload, format='json'
+            )
+        self.assertIn(response.status_code, (200, 201), response.data)
+        return len(queries)
+
+    def test_create(self):
+        for size in (2, 30):
+            with self.subTest(size=size):
+                self.assertEqual(
+                    self.count_queries(
+                        'post', '/api/recipes/', self.recipe_payload(size)
+                    ),
+                    17
+                )
+
+    def test_update(self):
+        for size in (2, 30):
+            recipe_id, = self.create_recipes(1, ingredients=size)
+            with self.subTest(size=size):
+                self.assertEqual(
+                    self.count_queries(
+                        'patch', f'/api/recipes/{recipe_id}/',
+                        self.recipe_payload(size, offset=size)
+                    ),
+                    19
+                )
+
+    def test_update_is_logged(self):
+        self.assertTrue(
+            logging.getLogger('api.serializers').isEnabledFor(logging.INFO)
+        )
+        recipe_id, = self.create_recipes(1, ingredients=2)
+        with self.assertLogs('api.serializers', 'INFO') as logs:
+            self.author_client.patch(
+                f'/api/recipes/{recipe_id}/',
+                self.recipe_payload(2, offset=1),
+                format='json'
+            )
+        self.assertIn(
+            f'Рецепт {recipe_id} обновлён: затронуто строк ингредиентов - 3',
+            logs.output[0]
+        )
+
+
+class CachedCountTest(RecipeAPITestCase):
+    """Кэшированное количество не обрезает страницы после изменений."""
+
+    def test_favorite_then_list(self):
+        recipe_id, = self.create_recipes(1)
+        url = '/api/recipes/?is_favorited=1'
+        self.assertEqual(self.reader_client.get(url).data['count'], 0)
+        self.reader_client.post(f'/api/recipes/{recipe_id}/favorite/')
+        response = self.reader_client.get(url)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipe_id]
+        )
+
+    def test_new_recipe_is_listed_with_stale_count(self):
+        self.create_recipes(2)
+        self.anonymous_client.get('/api/recipes/?limit=2')
+        ids = self.create_recipes(1)
+        response = self.anonymous_client.get('/api/recipes/?limit=2')
+        self.assertEqual(response.data['count'], 3)
+        self.assertIsNotNone(response.data['next'])
+        response = self.anonymous_client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertNotIn(ids[0], [
+            recipe['id'] for recipe in response.data['results']
+        ])
+
+    def test_subscriptions_follow_new_author(self):
+        self.reader_client.get('/api/users/subscriptions/?limit=1')
+        Subscribe.objects.create(user=self.reader, author=self.author)
+        response = self.reader_client.get('/api/users/subscriptions/?limit=1')
+        self.assertEqual(response.data['count'], 1)
+
+
+class RecipeUpdateTest(RecipeAPITestCase):
+    """Изменение рецепта не затирает счётчики, изменённые параллельно."""
+
+    def test_concurrent_counter_change_is_kept(self):
+        recipe_id, = self.create_recipes(1)
+        recipe = Recipe.objects.get(pk=recipe_id)
+        Recipe.objects.filter(pk=recipe_id).update(
+            favorites_count=F('favorites_count') + 1,
+            in_carts_count=F('in_carts_count') + 1,
+            image_variants={'320': {}}
+        )
+        request = APIRequestFactory().patch('/')
+        request.user = self.author
+        serializer = RecipeCreateSerializer(
+            recipe,
+            data={**self.recipe_payload(), 'name': 'Щи'},
+            partial=True,
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.validated_data.pop('image')
+        serializer.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Щи')
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (1, 1)
+        )
+        self.assertEqual(recipe.image_variants, {'320': {}})
+
+
+class RecipeBodySizeTest(RecipeAPITestCase):
+    """Слишком большое тело отклоняется до разбора JSON."""
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=1024)
+    def test_large_body_is_rejected(self):
+        recipe_id, = self.create_recipes(1)
+        payload = self.recipe_payload(text='щи' * 64 * 1024)
+        with mock.patch('rest_framework.parsers.JSONParser.parse') as parse:
+            for response in (
+                self.author_client.post(
+                    '/api/recipes/', payload, format='json'
+                ),
+                self.author_client.patch(
+                    f'/api/recipes/{recipe_id}/', payload, format='json'
+                ),
+            ):
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('image', response.data)
+        parse.assert_not_called()
+
+
+class ReferenceDataTest(TestCase):
+    """Загрузка справочников сбрасывает их кэш."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_import_data_invalidates_cache(self):
+        self.assertEqual(self.client.get('/api/tags/').json(), [])
+        self.assertEqual(self.client.get('/api/ingredients/').json(), [])
+        self.assertEqual(
+            self.client.get('/api/ingredients/?name=соль').json(), []
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_data', stdout=io.StringIO())
+        self.assertEqual(
+            len(self.client.get('/api/tags/').json()), Tag.objects.count()
+        )
+        self.assertEqual(
+            len(self.client.get('/api/ingredients/').json()),
+            Ingredient.objects.count()
+        )
+        self.assertTrue(self.client.get('/api/ingredients/?name=соль').json())
+
+
+class RecipeFilterTest(RecipeAPITestCase):
+    """Фильтры ленты рецептов работают через EXISTS без дублей."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe_ids = self.create_recipes(3)
+        Favorite.objects.create(user=self.reader, recipe_id=self.recipe_ids[0])
+
+    def test_recipe_with_several_tags_is_returned_once(self):
+        response = self.anonymous_client.get(
+            '/api/recipes/?tags=tag0&tags=tag1&limit=10'
+        )
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(
+            sorted(recipe['id'] for recipe in response.data['results']),
+            self.recipe_ids
+        )
+
+    def test_new_tag_is_accepted_before_cache_expires(self):
+        self.anonymous_client.get('/api/recipes/?tags=tag0')
+        Tag.objects.bulk_create([
+            Tag(name='Новый', slug='new', color='#111111')
+        ])
+        response = self.anonymous_client.get('/api/recipes/?tags=new')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
+        response = self.anonymous_client.get('/api/recipes/?tags=missing')
+        self.assertEqual(response.status_code, 400)
+
+    def test_filters_use_indexes(self):
+        request = APIRequestFactory().get('/')
+        request.user = self.reader
+        queryset = RecipeFilter(
+            QueryDict(
+                'tags=tag0&tags=tag1&is_favorited=1&is_in_shopping_cart=1'
+                f'&author={self.author.id}'
+            ),
+            Recipe.objects.all(),
+            request=request
+        ).qs
+        sql = str(queryset.query)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertNotIn('JOIN', sql)
+        self.assertEqual(sql.count('EXISTS'), 3)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            self.assertNotIn('Seq Scan', queryset.explain())
+        else:
+            plan = queryset.explain()
+            self.assertNotIn('SCAN', plan)
+            self.assertIn('recipe_author_pub_date_idx', plan)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImageStorageTest(TestCase):
+    """Оригиналы хранятся без EXIF, копии заменяются целиком."""
+
+    def test_exif_is_removed_before_storing(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x8825] = {2: (55.0, 45.0, 0.0)}
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 4), 'red').save(buffer, 'JPEG', exif=exif)
+        name = store_image(ContentFile(buffer.getvalue(), name='photo.JPG'))
+        self.assertTrue(name.endswith('.jpg'))
+        with default_storage.open(name) as file, Image.open(file) as image:
+            self.assertFalse(image.getexif())
+            self.assertEqual(image.size, (4, 8))
+
+    def test_save_image_replaces_file(self):
+        name = 'media/variants/test/100.webp'
+        for color in ('red', 'blue'):
+            save_image(Image.new('RGB', (8, 8), color), name, format='WEBP')
+        with default_storage.open(name) as file, Image.open(file) as image:
+            self.assertGreater(image.convert('RGB').getpixel((0, 0))[2], 200)
+        directories, files = default_storage.listdir('media/variants/test')
+        self.assertEqual(files, ['100.webp'])
+
+
+class PreUploadedImageTest(RecipeAPITestCase):
+    """Изображение, загруженное заранее, обрабатывается один раз."""
+
+    def upload(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), 'green').save(buffer, 'PNG')
+        buffer.name = 'photo.png'
+        buffer.seek(0)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.author_client.post(
+                '/api/recipes/images/', {'image': buffer}, format='multipart'
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(callbacks), 1)
+        return response.data['image']
+
+    def create(self, token):
+        with mock.patch('api.serializers.schedule_variants') as schedule:
+            response = self.author_client.post(
+                '/api/recipes/', self.recipe_payload(image=token),
+                format='json'
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        return Recipe.objects.get(pk=response.data['id']), schedule
+
+    def test_ready_variants_are_not_scheduled_again(self):
+        token = self.upload()
+        recipe, schedule = self.create(token)
+        schedule.assert_called_once_with(recipe.image.name)
+        build_variants(recipe.image.name)
+        recipe, schedule = self.create(token)
+        schedule.assert_not_called()
+        self.assertEqual(set(recipe.image_variants), {
+            str(width) for width in settings.RECIPE_IMAGE_WIDTHS
+        })
+
+
+class ToggleTest(RecipeAPITestCase):
+    """Повторное добавление и удаление не меняют счётчики."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe_id, = self.create_recipes(1)
+
+    def test_repeated_toggles(self):
+        for name in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{self.recipe_id}/{name}/'
+            statuses = [
+                self.reader_client.post(url).status_code for _ in range(3)
+            ]
+            self.assertEqual(statuses, [201, 400, 400])
+            with override_settings(IDEMPOTENT_TOGGLES=True):
+                self.assertEqual(self.reader_client.post(url).status_code, 200)
+            statuses = [
+                self.reader_client.delete(url).status_code for _ in range(2)
+            ]
+            self.assertEqual(statuses, [204, 400])
+        recipe = Recipe.objects.get(pk=self.recipe_id)
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (0, 0)
+        )
+
+    def test_non_numeric_id_is_rejected(self):
+        for url in ('/api/recipes/abc/favorite/',
+                    '/api/recipes/abc/shopping_cart/',
+                    '/api/users/abc/subscribe/'):
+            for method in ('post', 'delete'):
+                with self.subTest(url=url, method=method):
+                    response = getattr(self.reader_client, method)(url)
+                    self.assertEqual(response.status_code, 400)
+
+    def test_repeated_subscribe(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        statuses = [self.reader_client.post(url).status_code for _ in range(2)]
+        self.assertEqual(statuses, [201, 400])
+        self.assertEqual(
+            Subscribe.objects.filter(user=self.reader).count(), 1
+        )
+
+
+@unittest.skipUnless(
+    connection.vendor == 'postgresql',
+    'SQLite выполняет записи по одной, гонки не воспроизводятся'
+)
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ConcurrentToggleTest(TransactionTestCase):
+    """Одновременные добавления одной пары дают одну строку."""
+    threads = 16
+
+    def setUp(self):
+        self.author = FoodgramUser.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='Pass-12345'
+        )
+        self.reader = FoodgramUser.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Читатель', last_name='Рецептов',
+            password='Pass-12345'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Борщ', text='Свёкла',
+            image='media/test.png', cooking_time=30
+        )
+        self.token = Token.objects.create(user=self.reader)
+
+    def hammer(self, method, url):
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def request():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+            try:
+                barrier.wait()
+                statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=request) for _ in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sorted(statuses)
+
+    def test_concurrent_toggles(self):
+        for name, model, counter in (
+            ('favorite', Favorite, 'favorites_count'),
+            ('shopping_cart', Cart, 'in_carts_count'),
+        ):
+            url = f'/api/recipes/{self.recipe.id}/{name}/'
+            self.assertEqual(
+                self.hammer('post', url),
+                [201] + [400] * (self.threads - 1)
+            )
+            self.assertEqual(model.objects.count(), 1)
+            self.recipe.refresh_from_db()
+            self.assertEqual(getattr(self.recipe, counter), 1)
+            self.assertEqual(
+                self.hammer('delete', url),
+                [204] + [400] * (self.threads - 1)
+            )
+            self.recipe.refresh_from_db()
+            self.assertEqual(getattr(self.recipe, counter), 0)
+
+
+class ShoppingListDownloadTest(RecipeAPITestCase):
+    """Список покупок во всех форматах собирается из одних строк."""
+
+    def download(self, format):
+        response = self.reader_client.get(
+            f'/api/recipes/download_shopping_cart/?format={format}'
+        )
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_formats(self):
+        self.assertEqual(json.loads(self.download('json')), [])
+        for recipe_id in self.create_recipes(2, ingredients=2):
+            self.reader_client.post(f'/api/recipes/{recipe_id}/shopping_cart/')
+        self.assertEqual(
+            self.download('txt'),
+            'Ингредиент 00 - 20 г\nИнгредиент 01 - 22 г\n'
+        )
+        self.assertEqual(
+            self.download('csv').splitlines(),
+            [
+                'Ингредиент,Количество,Единица измерения',
+                'Ингредиент 00,20,г',
+                'Ингредиент 01,22,г',
+            ]
+        )
+        self.assertEqual(json.loads(self.download('json')), [
+            {'name': 'Ингредиент 00', 'amount': 20, 'measurement_unit': 'г'},
+            {'name': 'Ингредиент 01', 'amount': 22, 'measurement_unit': 'г'},
+        ])
+
+
+class RecipeSearchTest(RecipeAPITestCase):
+    """Поисковый вектор ведётся при любом сохранении рецепта."""
+
+    def test_list_does_not_load_search_vector(self):
+        self.create_recipes(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.anonymous_client.get('/api/recipes/')
+        self.assertFalse(any(
+            'search_vector' in query['sql'] for query in queries
+        ))
+
+    def test_ordering_params_are_rejected_in_cursor_mode(self):
+        for param in ('search=борщ', 'ordering=-favorites_count'):
+            response = self.anonymous_client.get(
+                f'/api/recipes/?pagination=cursor&{param}'
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(param.partition('=')[0], response.data)
+
+    @unittest.skipUnless(
+        connection.vendor == 'postgresql', 'Поиск ведётся в PostgreSQL'
+    )
+    def test_vector_follows_model_saves(self):
+        recipe_id, = self.create_recipes(1, ingredients=1)
+        recipe = Recipe.objects.get(pk=recipe_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = 'Солянка'
+            recipe.save()
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=self.ingredients[10], amount=5
+            )
+        for text in ('солянка', 'Ингредиент 10'):
+            self.assertTrue(Recipe.objects.filter(
+                pk=recipe_id, search_vector=text
+            ).exists())
+
+
+@override_settings(FEED_FANOUT_LIMIT=2)
+class FeedTest(RecipeAPITestCase):
+    """Лента сливает записи FeedEntry и рецепты популярных авторов."""
+
+    def setUp(self):
+        super().setUp()
+        self.chef = FoodgramUser.objects.create_user(
+            email='chef@example.com',
+            username='chef',
+            first_name='Шеф',
+            last_name='Повар',
+            password='Pass-12345'
+        )
+        Subscribe.objects.create(user=self.reader, author=self.author)
+        Subscribe.objects.create(user=self.reader, author=self.chef)
+        Subscribe.objects.create(user=self.author, author=self.chef)
+        chef_client = self.get_client(self.chef)
+        self.recipe_ids = []
+        for _ in range(3):
+            self.recipe_ids += self.create_recipes(1)
+            self.recipe_ids.append(chef_client.post(
+                '/api/recipes/', self.recipe_payload(), format='json'
+            ).data['id'])
+        self.recipe_ids.reverse()
+
+    def test_feed_pages_merge_both_sources(self):
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(), 3
+        )
+        ids = []
+        url = '/api/recipes/feed/?limit=4'
+        response = self.reader_client.get(url)
+        ids += [recipe['id'] for recipe in response.data['results']]
+        with self.assertNumQueries(7):
+            response = self.reader_client.get(response.data['next'])
+        ids += [recipe['id'] for recipe in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(ids, self.recipe_ids)
+
+    def test_feed_applies_filters(self):
+        Favorite.objects.create(user=self.reader, recipe_id=self.recipe_ids[0])
+        Favorite.objects.create(user=self.reader, recipe_id=self.recipe_ids[1])
+        response = self.reader_client.get(
+            '/api/recipes/feed/?is_favorited=1'
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            self.recipe_ids[:2]
+        )
+
+    def test_feed_entries_use_index(self):
+        queryset = FeedEntry.objects.filter(user=self.reader).order_by(
+            '-pub_date', '-recipe_id'
+        ).values_list('pub_date', 'recipe_id')[:10]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertNotIn('Seq Scan', plan)
+            self.assertNotIn('Sort', plan)
+        else:
+            plan = queryset.explain()
+            self.assertIn('feed_entry_user_pub_date_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+class RecipeIngredientIndexTest(RecipeAPITestCase):
+    """Процессы применяют изменения индекса из журнала без перестройки."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe_id, = self.create_recipes(1, ingredients=2)
+        self.writer = RecipeIngredientIndex()
+        self.reader = RecipeIngredientIndex()
+        self.old = [ingredient.id for ingredient in self.ingredients[:2]]
+        self.new = [ingredient.id for ingredient in self.ingredients[5:8]]
+        for index in (self.writer, self.reader):
+            self.assertEqual(index.match(self.old, 0), [self.recipe_id])
+
+    def update(self, ingredient_ids):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.writer.update_recipe(self.recipe_id, ingredient_ids)
+
+    def test_changes_are_applied_from_log(self):
+        self.update(self.new)
+        self.update(self.new[:2])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.reader.match(self.new[:1], 0), [])
+            self.assertEqual(
+                self.reader.match(self.new[:1], 1), [self.recipe_id]
+            )
+            self.assertEqual(self.reader.match(self.old, 0), [])
+
+    def test_lost_change_triggers_rebuild(self):
+        self.update(self.new)
+        cache.delete(self.writer.change_key.format(
+            version=cache.get(self.writer.version_key)
+        ))
+        self.update(())
+        with self.assertNumQueries(1):
+            self.reader.match(self.new, 0)
+        self.assertEqual(self.reader.version, self.writer.version)
+
+
+class CachedTokenAuthenticationTest(RecipeAPITestCase):
+    """Токен кэшируется только в общем кэше и сбрасывается при выходе."""
+
+    def test_local_cache_reads_token_every_time(self):
+        with self.settings(CACHE_IS_SHARED=False):
+            for _ in range(2):
+                with self.assertNumQueries(1):
+                    self.reader_client.get('/api/users/me/')
+
+    def test_shared_cache_is_invalidated(self):
+        with self.settings(CACHE_IS_SHARED=True):
+            self.reader_client.get('/api/users/me/')
+            with self.assertNumQueries(0):
+                response = self.reader_client.get('/api/users/me/')
+            self.assertEqual(response.status_code, 200)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.reader.is_active = False
+                self.reader.save()
+            response = self.reader_client.get('/api/users/me/')
+            self.assertEqual(response.status_code, 401)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.reader.is_active = True
+                self.reader.save()
+            self.reader_client.get('/api/users/me/')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.reader.auth_token.delete()
+            response = self.reader_client.get('/api/users/me/')
+            self.assertEqual(response.status_code, 401)
+
+
+class RecipeCacheTest(RecipeAPITestCase):
+    """Кэш рецепта не зависит от адреса сайта, с которого был запрос."""
+
+    def test_urls_are_built_for_current_host(self):
+        recipe_id, = self.create_recipes(1)
+        Recipe.objects.filter(pk=recipe_id).update(image_variants={
+            '320': {'webp': 'media/variants/recipe/320.webp'}
+        })
+        for host, cache_status in (('a.example', 'MISS'),
+                                   ('b.example', 'HIT')):
+            response = self.anonymous_client.get(
+                f'/api/recipes/{recipe_id}/', HTTP_HOST=host
+            )
+            self.assertEqual(response['X-Cache'], cache_status)
+            self.assertTrue(
+                response.data['image'].startswith(f'http://{host}/media/')
+            )
+            self.assertEqual(
+                response.data['image_variants']['320']['webp'],
+                f'http://{host}/media/media/variants/recipe/320.webp'
+            )
+
+    @override_settings(REFERENCE_CACHE_TIMEOUT=1)
+    def test_entries_outlive_reference_timeout(self):
+        recipe_id, = self.create_recipes(1)
+        url = f'/api/recipes/{recipe_id}/'
+        self.assertEqual(self.anonymous_client.get(url)['X-Cache'], 'MISS')
+        sleep(1.1)
+        self.assertEqual(self.anonymous_client.get(url)['X-Cache'], 'HIT')
+
+
+class ReplicaRouterTest(RecipeAPITestCase):
+    """Чтение с реплик: одна реплика на запрос, отказ - повтор с основной."""
+    databases = {'default', *REPLICAS}
+
+    def setUp(self):
+        super().setUp()
+        ReplicaRouter.unavailable.clear()
+        self.addCleanup(ReplicaRouter.unavailable.clear)
+
+    def test_replica_is_pinned_for_request(self):
+        router = ReplicaRouter()
+        with self.settings(DATABASE_REPLICAS=list(REPLICAS)):
+            self.assertEqual(router.db_for_read(Recipe), 'default')
+            token = request_replica.set({'alias': None, 'failed': False})
+            try:
+                aliases = {router.db_for_read(Recipe) for _ in range(20)}
+            finally:
+                request_replica.reset(token)
+        self.assertEqual(len(aliases), 1)
+        self.assertIn(aliases.pop(), REPLICAS)
+
+    def test_failed_replica_falls_back_to_primary(self):
+        self.create_recipes(2)
+        with self.settings(DATABASE_REPLICAS=[REPLICAS[0]]):
+            response = self.reader_client.get('/api/recipes/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 2)
+            self.assertIn(REPLICAS[0], ReplicaRouter.unavailable)
+            self.assertEqual(ReplicaRouter().get_replica(), 'default')
+
+    def test_write_makes_client_read_from_primary(self):
+        with self.settings(DATABASE_REPLICAS=[REPLICAS[1]]):
+            self.create_recipes(1)
+            response = self.author_client.get('/api/recipes/')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(ReplicaRouter.unavailable, {})
+
+    def test_login_makes_token_requests_read_from_primary(self):
+        with self.settings(DATABASE_REPLICAS=[REPLICAS[1]]):
+            response = self.anonymous_client.post('/api/auth/token/login/', {
+                'email': 'reader@example.com',
+                'password': 'Pass-12345'
+            })
+            client = APIClient()
+            client.credentials(
+                HTTP_AUTHORIZATION=f'Token {response.data["auth_token"]}'
+            )
+            response = client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ReplicaRouter.unavailable, {})
+
+
+class AsgiTest(RecipeAPITestCase):
+    """Под ASGI промежуточный слой асинхронный, выгрузка идёт потоком."""
+
+    def test_middleware_does_not_serialize_requests(self):
+        async def slow_view(request):
+            await asyncio.sleep(0.2)
+            return HttpResponse()
+
+        handler = AsgiUrlconfMiddleware(ReplicaMiddleware(slow_view))
+        self.assertTrue(iscoroutinefunction(handler))
+
+        async def run():
+            started = perf_counter()
+            await asyncio.gather(*(
+                handler(RequestFactory().get('/')) for _ in range(4)
+            ))
+            return perf_counter() - started
+
+        with self.settings(DATABASE_REPLICAS=list(REPLICAS)):
+            self.assertLess(async_to_sync(run)(), 0.6)
+
+    def test_sync_chain_stays_sync(self):
+        handler = AsgiUrlconfMiddleware(ReplicaMiddleware(
+            lambda request: HttpResponse()
+        ))
+        self.assertFalse(iscoroutinefunction(handler))
+        self.assertEqual(
+            handler(RequestFactory().get('/')).status_code, 200
+        )
+
+
+class AsgiStreamingTest(TransactionTestCase):
+    """Список покупок под ASGI отдаётся частями, а не одним телом."""
+
+    def test_download_is_streamed(self):
+        user = FoodgramUser.objects.create_user(
+            email='cook@example.com',
+            username='cook',
+            first_name='Повар',
+            last_name='Поваров',
+            password='Pass-12345'
+        )
+        token = Token.objects.create(user=user)
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        recipe = Recipe.objects.create(
+            author=user, name='Суп', text='Суп', image='media/soup.png'
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=5
+        )
+        Cart.objects.create(user=user, recipe=recipe)
+        ShoppingListItem.objects.add_recipe(user.id, recipe.id)
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        stream_connection = mock.patch('api.async_views.connection').start()
+        self.addCleanup(mock.patch.stopall)
+        async_to_sync(StreamingASGIHandler())({
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/recipes/download_shopping_cart/',
+            'query_string': b'',
+            'headers': [
+                (b'authorization', f'Token {token.key}'.encode()),
+                (b'host', b'testserver'),
+            ],
+        }, receive, send)
+        self.assertEqual(messages[0]['status'], 200)
+        bodies = [message for message in messages[1:] if message.get('body')]
+        self.assertTrue(all(message['more_body'] for message in bodies))
+        self.assertIn('Соль', b''.join(
+            message['body'] for message in bodies
+        ).decode())
+        self.assertEqual([lane.streams for lane in stream_lanes],
+                         [0] * len(stream_lanes))
+        stream_connection.close.assert_called_once_with()
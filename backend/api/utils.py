@@ -0,0 +1,40 @@
+from django.db import connections, router
+from django.db.models.signals import post_save
+
+
+def insert_ignore(model, **values):
+    """Добавляет строку одним INSERT ... ON CONFLICT DO NOTHING RETURNING."""
+    instance = model(**values)
+    using = router.db_for_write(model)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in values]
+    sql = (
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        f'({", ".join(quote(field.column) for field in fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(fields))}) '
+        f'ON CONFLICT DO NOTHING RETURNING {quote(model._meta.pk.column)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            field.get_db_prep_save(
+                getattr(instance, field.attname),
+                connection
+            )
+            for field in fields
+        ])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    instance.pk = row[0]
+    instance._state.adding = False
+    instance._state.db = using
+    post_save.send(
+        sender=model,
+        instance=instance,
+        created=True,
+        update_fields=None,
+        raw=False,
+        using=using
+    )
+    return instance
@@ -1,25 +1,42 @@
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import (Count, Exists, F, OuterRef, Prefetch, Value,
+                              Window)
+from django.db.transaction import atomic
+from django.db.models.functions import RowNumber
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as UVS
 from rest_framework import mixins, status
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
-from api.filters import IngredientFilter, RecipeFilter
-from api.paginators import PageNumberLimitPaginator
+from api.cache import (ingredients_cache, RecipeCache, recipe_cache,
+                       ReferenceCacheMixin, tags_cache)
+from api.filters import RecipeFilter
+from api.images import make_image_token, schedule_variants, store_image
+from api.indexes import ingredient_index, recipe_index
+from api.paginators import (CachedCountPaginator, PageNumberLimitPaginator,
+                            FeedCursorPaginator, RecipePaginator)
 from api.permissions import IsAuthAndIsAuthorOrReadOnly
-from api.serializers import (CartSerializer, FavoriteSerializer,
-                             IngredientSerializer, RecipeCreateSerializer,
-                             RecipeListSerializer, SubscribeSerializer,
-                             SubscriptionsSerializer, TagSerializer)
-from recipes.models import (Cart, Favorite, Ingredient, Recipe,
-                            RecipeIngredient, Tag)
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                           ShoppingListTextRenderer)
+from api.serializers import (CookSerializer, IngredientSerializer,
+                             RecipeCreateSerializer, RecipeImageSerializer,
+                             RecipeListSerializer, RecipeSimpleSerializer,
+                             RecipesLimitSerializer, SubscriptionsSerializer,
+                             TagSerializer)
+from api.utils import insert_ignore
+from recipes.models import (Cart, Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingListItem, Tag)
 from users.models import Subscribe
 
 
@@ -31,7 +48,7 @@ class UserViewSet(UVS):
     filter_backends = (DjangoFilterBackend,)
     permission_classes = (AllowAny,)
     http_method_names = ['get', 'post', 'delete']
-    pagination_class = PageNumberLimitPaginator
+    pagination_class = CachedCountPaginator
 
     def get_permissions(self):
         if self.action == 'me':
@@ -41,28 +58,45 @@ class UserViewSet(UVS):
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,))
     def subscribe(self, request, **kwargs):
+        if not str(kwargs['id']).isdigit():
+            return Response(
+                {'errors': 'Некорректный id пользователя'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         author = get_object_or_404(FoodgramUser, id=kwargs['id'])
         user = request.user
         if request.method == 'POST':
-            serializer = SubscribeSerializer(
-                data={
-                    'user': user.id,
-                    'author': author.id
-                },
-                context={
-                    'request': request
-                }
+            if user == author:
+                return Response(
+                    {'errors': 'Невозможно подписаться на самого себя'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            created = insert_ignore(
+                Subscribe,
+                user_id=user.id,
+                author_id=author.id
+            ) is not None
+            if not created and not settings.IDEMPOTENT_TOGGLES:
+                return Response(
+                    {'errors': 'Вы уже подписаны на этого автора!'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            context = self.get_serializer_context()
+            context['subscriptions'] = {author.id}
+            return Response(
+                SubscriptionsSerializer(author, context=context).data,
+                status=(
+                    status.HTTP_201_CREATED if created
+                    else status.HTTP_200_OK
+                )
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         deleted, _ = Subscribe.objects.filter(
             user=user,
             author=author
         ).delete()
 
-        if not deleted:
+        if not deleted and not settings.IDEMPOTENT_TOGGLES:
             return Response(
                 {'errors': 'Вы не подписаны на данного пользователя'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -70,10 +104,21 @@ class UserViewSet(UVS):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['get'],
-            permission_classes=[IsAuthAndIsAuthorOrReadOnly])
+            permission_classes=[IsAuthAndIsAuthorOrReadOnly],
+            pagination_class=PageNumberLimitPaginator)
     def subscriptions(self, request):
-        queryset = FoodgramUser.objects.filter(following__user=request.user)
+        limit_serializer = RecipesLimitSerializer(data=request.query_params)
+        limit_serializer.is_valid(raise_exception=True)
+        queryset = FoodgramUser.objects.filter(
+            following__user=request.user
+        ).annotate(
+            recipes_count=Count('recipes')
+        ).order_by('username')
         page = self.paginate_queryset(queryset)
+        self.attach_recipes(
+            page,
+            limit_serializer.validated_data.get('recipes_limit')
+        )
         serializer = SubscriptionsSerializer(
             page,
             many=True,
@@ -81,118 +126,328 @@ class UserViewSet(UVS):
         )
         return self.get_paginated_response(serializer.data)
 
+    def attach_recipes(self, authors, limit):
+        """Загружает превью рецептов всех авторов страницы одним запросом."""
+        recipes = Recipe.objects.filter(author__in=authors).only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
+            'author_id'
+        )
+        if limit:
+            recipes = recipes.annotate(recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=F('author_id'),
+                order_by=F('pub_date').desc()
+            ))
+            sql, params = recipes.query.sql_with_params()
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) AS ranked '
+                'WHERE recipe_rank <= %s ORDER BY recipe_rank',
+                (*params, limit)
+            )
+        previews = {author.id: [] for author in authors}
+        for recipe in recipes:
+            previews[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipes_preview = previews[author.id]
+
 
 class RecipeViewSet(ModelViewSet):
     queryset = Recipe.objects.all()
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, OrderingFilter)
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
     http_method_names = ('get', 'post', 'patch', 'delete')
-    pagination_class = PageNumberLimitPaginator
+    pagination_class = RecipePaginator
     permission_classes = (IsAuthAndIsAuthorOrReadOnly, )
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset().defer('search_vector')
+        if self.action in ('list', 'retrieve', 'cook', 'feed'):
+            queryset = queryset.select_related('author').prefetch_related(
+                'tags',
+                Prefetch(
+                    'recipes',
+                    queryset=RecipeIngredient.objects.select_related(
+                        'ingredient'
+                    )
+                )
+            )
+        return self.annotate_flags(queryset)
+
+    def annotate_flags(self, queryset, **annotations):
+        """Добавляет признаки избранного и корзины текущего пользователя."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                **{name: Value(False) for name in annotations}
+            )
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(Cart.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )),
+            **annotations
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт с не зависящей от пользователя частью из RecipeCache."""
+        pk = kwargs[self.lookup_field]
+        if not str(pk).isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        data = recipe_cache.get(pk)
+        if data is None:
+            response = super().retrieve(request, *args, **kwargs)
+            recipe_cache.set(pk, response.data, request)
+            response['X-Cache'] = 'MISS'
+            return response
+        state = self.annotate_flags(
+            Recipe.objects.filter(pk=pk),
+            is_subscribed=Exists(Subscribe.objects.filter(
+                user=request.user.id,
+                author=OuterRef('author')
+            ))
+        ).values(
+            'is_subscribed', *RecipeCache.volatile_fields
+        ).first()
+        if state is None:
+            raise Http404
+        return Response(
+            recipe_cache.merge(data, state, request),
+            headers={'X-Cache': 'HIT'}
+        )
+
+    def check_content_length(self, request, image_size):
+        """Отклоняет тело запроса больше изображения с запасом на поля."""
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if length > image_size + 64 * 1024:
+            raise ValidationError({'image': [
+                f'Размер изображения превышает '
+                f'{settings.RECIPE_IMAGE_MAX_SIZE} байт'
+            ]})
+
+    def create(self, request, *args, **kwargs):
+        self.check_content_length(
+            request, settings.RECIPE_IMAGE_MAX_SIZE * 4 // 3
+        )
+        return super().create(request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        self.check_content_length(
+            request, settings.RECIPE_IMAGE_MAX_SIZE * 4 // 3
+        )
+        return super().update(request, *args, **kwargs)
+
+    @action(detail=False, methods=['get'], url_path='cache-stats',
+            permission_classes=(IsAdminUser, ))
+    def cache_stats(self, request):
+        """Попадания и промахи кэша рецептов."""
+        return Response(recipe_cache.stats())
+
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'cook', 'feed'):
             return RecipeListSerializer
         return RecipeCreateSerializer
 
-    def serializer_create(self, user_id, pk, serializer):
-        serializer = serializer(
-            data={
-                'user': user_id,
-                'recipe': pk
-            }
+    @action(detail=False, methods=['get'],
+            permission_classes=(AllowAny, ),
+            pagination_class=PageNumberLimitPaginator)
+    def cook(self, request):
+        """Рецепты, которые можно приготовить из указанных ингредиентов."""
+        serializer = CookSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        page = self.paginate_queryset(recipe_index.match(
+            serializer.validated_data['ingredients'],
+            serializer.validated_data['missing']
+        ))
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in page if pk in recipes],
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated, ),
+            pagination_class=FeedCursorPaginator)
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
+        recipes = self.filter_queryset(Recipe.objects.all())
+        entries = FeedEntry.objects.filter(user=request.user)
+        if recipes.query.has_filters():
+            entries = entries.filter(recipe__in=recipes.values('id'))
+        page = self.paginate_queryset((
+            (entries, 'recipe_id'),
+            (
+                recipes.filter(
+                    author__in=FeedEntry.objects.popular_authors(request.user)
+                ),
+                'id'
+            )
+        ))
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in page if pk in recipes],
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'],
+            permission_classes=(IsAuthenticated, ),
+            parser_classes=(MultiPartParser, ))
+    def images(self, request):
+        """Предварительная загрузка изображения рецепта."""
+        self.check_content_length(request, settings.RECIPE_IMAGE_MAX_SIZE)
+        serializer = RecipeImageSerializer(
+            data=request.data,
+            context=self.get_serializer_context()
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        name = store_image(serializer.validated_data['image'])
+        schedule_variants(name)
         return Response(
-            serializer.data,
+            {'image': make_image_token(name, request.user)},
             status=status.HTTP_201_CREATED
         )
 
-    def serializer_delete(self, user_id, pk, model):
-        deleted, _ = model.objects.filter(
-            user=user_id,
-            recipe=pk
-        ).delete()
-        if not deleted:
+    def toggle(self, request, pk, model, field, errors):
+        """Добавляет рецепт в список пользователя или удаляет из него."""
+        already_added, not_added = errors
+        if not str(pk).isdigit():
             return Response(
-                {'errors': 'Рецепт отсутствует в избранном'},
+                {'errors': 'Некорректный id рецепта'},
                 status=status.HTTP_400_BAD_REQUEST
+            ), False
+        if request.method == 'POST':
+            recipe = get_object_or_404(
+                Recipe.objects.only(*RecipeSimpleSerializer.Meta.fields),
+                pk=pk
             )
-        return Response(status=status.HTTP_204_NO_CONTENT)
+            changed = insert_ignore(
+                model,
+                user_id=request.user.id,
+                recipe_id=recipe.id
+            ) is not None
+            if changed or settings.IDEMPOTENT_TOGGLES:
+                response = Response(
+                    RecipeSimpleSerializer(
+                        recipe,
+                        context=self.get_serializer_context()
+                    ).data,
+                    status=(
+                        status.HTTP_201_CREATED if changed
+                        else status.HTTP_200_OK
+                    )
+                )
+            else:
+                response = Response(
+                    {'errors': already_added},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            delta = 1
+        else:
+            changed, _ = model.objects.filter(
+                user=request.user,
+                recipe=pk
+            ).delete()
+            if changed or settings.IDEMPOTENT_TOGGLES:
+                response = Response(status=status.HTTP_204_NO_CONTENT)
+            else:
+                response = Response(
+                    {'errors': not_added},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            delta = -1
+        if changed:
+            Recipe.objects.filter(pk=pk).update(**{field: F(field) + delta})
+        return response, changed
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated, ])
+    @atomic
     def favorite(self, request, **kwargs):
-        if request.method == 'POST':
-            return self.serializer_create(
-                request.user.id,
-                kwargs['pk'],
-                FavoriteSerializer
-            )
-        return self.serializer_delete(
-            request.user.id,
+        response, _ = self.toggle(
+            request,
             kwargs['pk'],
-            Favorite
+            Favorite,
+            'favorites_count',
+            ('Рецепт уже в избранном', 'Рецепт отсутствует в избранном')
         )
+        return response
 
     @action(detail=False, methods=['get'],
-            permission_classes=[IsAuthAndIsAuthorOrReadOnly])
+            permission_classes=[IsAuthenticated],
+            renderer_classes=(ShoppingListTextRenderer,
+                              ShoppingListCSVRenderer,
+                              ShoppingListJSONRenderer))
     def download_shopping_cart(self, request):
-        items = RecipeIngredient.objects.select_related(
-            'recipe', 'ingredient'
-        ).filter(recipe__shopping_carts__user=request.user).values(
+        items = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values_list(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(
-            total=Sum('amount')
+            'ingredient__measurement_unit',
+            'amount'
         ).order_by('ingredient__name')
-        response = self.make_shoplist(items)
-        return response
-
-    def make_shoplist(self, items):
-        items_list = []
-        for item in items:
-            items_list.append(
-                f"{item['ingredient__name']} - "
-                f"{item['total']} {item['ingredient__measurement_unit']}"
-            )
-        response = HttpResponse(
-            '\n'.join(items_list),
-            content_type='text/plan'
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(items.iterator()),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shoplist.{renderer.format}"'
         )
-        response['Content-Disposition'] = 'attachment; filename="shoplist.txt"'
         return response
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthAndIsAuthorOrReadOnly])
+    @atomic
     def shopping_cart(self, request, **kwargs):
-        if request.method == 'POST':
-            return self.serializer_create(
-                request.user.id,
-                kwargs['pk'],
-                CartSerializer
-            )
-        return self.serializer_delete(
-            request.user.id,
+        response, changed = self.toggle(
+            request,
             kwargs['pk'],
-            Cart
+            Cart,
+            'in_carts_count',
+            ('Рецепт уже в корзине', 'Рецепт отсутствует в корзине')
         )
+        if changed and request.method == 'POST':
+            ShoppingListItem.objects.add_recipe(request.user.id, kwargs['pk'])
+        elif changed:
+            ShoppingListItem.objects.remove_recipe(
+                request.user.id,
+                kwargs['pk']
+            )
+        return response
 
 
-class IngredientViewSet(mixins.ListModelMixin,
+class IngredientViewSet(ReferenceCacheMixin,
+                        mixins.ListModelMixin,
                         mixins.RetrieveModelMixin,
                         GenericViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+    reference_cache = ingredients_cache
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return self.cached_list(request)
+        return Response(ingredient_index.search(name))
 
 
-class TagViewSet(mixins.ListModelMixin,
+class TagViewSet(ReferenceCacheMixin,
+                 mixins.ListModelMixin,
                  mixins.RetrieveModelMixin,
                  GenericViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
+    reference_cache = tags_cache
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_list(request)
@@ -0,0 +1,9 @@
+from django.urls import include, path
+
+from foodgram.urls import urlpatterns as wsgi_urlpatterns
+
+
+urlpatterns = [
+    path('api/', include('api.async_urls')),
+    *wsgi_urlpatterns
+]
@@ -0,0 +1,14 @@
+# Кэш в памяти процесса не виден другим процессам, и сброс записи в нём
+# до них не доходит: с таким кэшем gunicorn запускает один воркер, а
+# токены авторизации не кэшируются.
+DEFAULT_CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache(backend):
+    """Виден ли кэш с бэкендом backend всем процессам сервера."""
+    return backend not in PROCESS_LOCAL_CACHE_BACKENDS
@@ -0,0 +1,160 @@
+import random
+from contextvars import ContextVar
+from hashlib import sha1
+from time import monotonic
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import (DEFAULT_DB_ALIAS, DatabaseError, InterfaceError,
+                       OperationalError, connections)
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+from foodgram.middleware import HybridMiddleware
+
+# Реплика запроса: None - чтение с основной базы, иначе словарь, в
+# котором роутер запоминает выбранную для запроса реплику.
+request_replica = ContextVar('request_replica', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# В Django 3.2 у кэша нет асинхронного API.
+cache_get_many = sync_to_async(
+    lambda *args: cache.get_many(*args), thread_sensitive=False
+)
+cache_set_many = sync_to_async(
+    lambda *args: cache.set_many(*args), thread_sensitive=False
+)
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """Закрывает разорванные постоянные соединения перед запросом."""
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+
+class ReplicaRouter:
+    """Чтение в запросах, помеченных ReplicaMiddleware, идёт с реплик."""
+    unavailable = {}
+
+    @classmethod
+    def mark_unavailable(cls, alias):
+        cls.unavailable[alias] = monotonic() + settings.REPLICA_RETRY_SECONDS
+
+    def get_replica(self):
+        now = monotonic()
+        replicas = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if self.unavailable.get(alias, 0) <= now
+        ]
+        random.shuffle(replicas)
+        for alias in replicas:
+            try:
+                connections[alias].ensure_connection()
+            except DatabaseError:
+                self.mark_unavailable(alias)
+                continue
+            return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        replica = request_replica.get()
+        if replica is None:
+            return DEFAULT_DB_ALIAS
+        if replica['alias'] is None:
+            replica['alias'] = self.get_replica()
+        return replica['alias']
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware(HybridMiddleware):
+    """Разрешает чтение с реплик для безопасных запросов."""
+    sticky_key = 'db-primary:{client}'
+
+    def get_client_keys(self, request):
+        """Ключи клиента: по IP и, если есть, по заголовку Authorization."""
+        clients = [
+            request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')[0].strip()
+            or request.META.get('REMOTE_ADDR', ''),
+            request.META.get('HTTP_AUTHORIZATION')
+        ]
+        return [
+            self.sticky_key.format(client=sha1(client.encode()).hexdigest())
+            for client in clients if client
+        ]
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        keys = self.get_client_keys(request)
+        safe = request.method in SAFE_METHODS
+        replica = {'alias': None, 'failed': False}
+        token = request_replica.set(
+            replica if safe and not cache.get_many(keys) else None
+        )
+        try:
+            response = self.get_response(request)
+            if replica['failed']:
+                request_replica.set(None)
+                response = self.get_response(request)
+        finally:
+            request_replica.reset(token)
+        if not safe:
+            cache.set_many(
+                dict.fromkeys(keys, True), settings.REPLICA_STICKY_SECONDS
+            )
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        keys = self.get_client_keys(request)
+        safe = request.method in SAFE_METHODS
+        replica = {'alias': None, 'failed': False}
+        token = request_replica.set(
+            replica if safe and not await cache_get_many(keys) else None
+        )
+        try:
+            response = await self.get_response(request)
+            if replica['failed']:
+                request_replica.set(None)
+                response = await self.get_response(request)
+        finally:
+            request_replica.reset(token)
+        if not safe:
+            await cache_set_many(
+                dict.fromkeys(keys, True), settings.REPLICA_STICKY_SECONDS
+            )
+        return response
+
+    def process_exception(self, request, exception):
+        replica = request_replica.get()
+        if (
+            replica is None
+            or replica['alias'] in (None, DEFAULT_DB_ALIAS)
+            or not isinstance(exception, (OperationalError, InterfaceError))
+        ):
+            return None
+        ReplicaRouter.mark_unavailable(replica['alias'])
+        try:
+            connections[replica['alias']].close()
+        except DatabaseError:
+            pass
+        replica['failed'] = True
+        return HttpResponse(status=503)
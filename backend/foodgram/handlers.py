@@ -0,0 +1,25 @@
+from django.core.handlers.asgi import ASGIHandler
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """ASGIHandler, передающий async_streaming_content потоковых ответов."""
+
+    async def send_response(self, response, send):
+        content = getattr(response, 'async_streaming_content', None)
+        if content is None:
+            return await super().send_response(response, send)
+
+        async def send_with_content(message):
+            if message['type'] == 'http.response.body' and not message.get(
+                'more_body'
+            ):
+                async for part in content:
+                    for chunk, _ in self.chunk_bytes(part):
+                        await send({
+                            'type': 'http.response.body',
+                            'body': chunk,
+                            'more_body': True,
+                        })
+            await send(message)
+
+        return await super().send_response(response, send_with_content)
@@ -0,0 +1,70 @@
+import os
+
+from foodgram.caches import DEFAULT_CACHE_BACKEND, is_shared_cache
+
+# Число ядер, доступных процессу (учитывает cpuset контейнера), а не
+# число ядер хоста.
+if hasattr(os, 'sched_getaffinity'):
+    cores = len(os.sched_getaffinity(0))
+else:
+    cores = os.cpu_count() or 1
+cores = min(cores, int(os.getenv('GUNICORN_MAX_CORES', 8)))
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# gthread - потоки поверх WSGI, uvicorn.workers.UvicornWorker - ASGI,
+# sync - однопоточные процессы.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+# Каждый поток держит своё соединение с базой при CONN_MAX_AGE.
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+if worker_class.startswith('uvicorn'):
+    wsgi_app = 'foodgram.asgi:application'
+    default_workers = cores
+    connections_per_worker = (
+        int(os.getenv('ASYNC_VIEW_WORKERS', 16))
+        + int(os.getenv('ASYNC_STREAM_WORKERS', 4))
+        + 1
+    )
+elif worker_class == 'gthread':
+    wsgi_app = 'foodgram.wsgi:application'
+    default_workers = cores + 1
+    connections_per_worker = threads
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+    default_workers = cores * 2 + 1
+    connections_per_worker = 1
+
+shared_cache = is_shared_cache(
+    os.getenv('CACHE_BACKEND', DEFAULT_CACHE_BACKEND)
+)
+if not shared_cache:
+    default_workers = 1
+
+# Соединений с каждой базой не больше DB_MAX_CONNECTIONS
+# (max_connections PostgreSQL за вычетом запаса на миграции и psql).
+max_connections = int(os.getenv('DB_MAX_CONNECTIONS', 90))
+default_workers = max(
+    1, min(default_workers, max_connections // connections_per_worker)
+)
+
+workers = int(os.getenv('GUNICORN_WORKERS', default_workers))
+
+if workers > 1 and not shared_cache:
+    raise RuntimeError(
+        'Несколько воркеров требуют общего кэша: задайте CACHE_BACKEND, '
+        'например django_redis.cache.RedisCache, или GUNICORN_WORKERS=1'
+    )
+if workers * connections_per_worker > max_connections:
+    raise RuntimeError(
+        f'{workers} воркеров открывают до '
+        f'{workers * connections_per_worker} соединений с базой, '
+        f'больше DB_MAX_CONNECTIONS={max_connections}'
+    )
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = 5
+max_requests = 1000
+max_requests_jitter = 100
+accesslog = '-'
@@ -4,6 +4,7 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from recipes.models import Ingredient, Tag
+from recipes.signals import reference_data_loaded
 
 
 class Command(BaseCommand):
@@ -12,10 +13,12 @@ class Command(BaseCommand):
             ingredients = json.loads(file.read())
             Ingredient.objects.bulk_create(
                 Ingredient(**ingredient) for ingredient in ingredients)
+            reference_data_loaded.send(sender=Ingredient)
 
         with open(f'{settings.BASE_DIR}/data/tags.json', 'r') as file:
             tags = json.loads(file.read())
             Tag.objects.bulk_create(
                 Tag(**tag) for tag in tags)
+            reference_data_loaded.send(sender=Tag)
 
         self.stdout.write('Данные загружены')
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.db.transaction import atomic
+
+from recipes.models import RecipeIngredient, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Сверяет и пересобирает итоги списков покупок по корзинам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сообщить о расхождениях, не исправляя их'
+        )
+
+    @atomic
+    def handle(self, *args, **options):
+        expected = {
+            (item['recipe__shopping_carts__user'], item['ingredient']):
+            item['total']
+            for item in RecipeIngredient.objects.filter(
+                recipe__shopping_carts__isnull=False
+            ).values(
+                'recipe__shopping_carts__user', 'ingredient'
+            ).annotate(
+                total=Sum('amount')
+            ).order_by()
+        }
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+        drift = {
+            key for key in {*expected, *actual}
+            if expected.get(key) != actual.get(key)
+        }
+        self.stdout.write(f'Расхождений: {len(drift)}')
+        if options['check'] or not drift:
+            return
+        ShoppingListItem.objects.all().delete()
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    amount=amount
+                )
+                for (user_id, ingredient_id), amount in expected.items()
+            ),
+            batch_size=1000
+        )
+        self.stdout.write('Списки покупок пересобраны')
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Cart, Favorite, Recipe
+
+
+def count_related(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                total=Count('id')
+            ).values('total')
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики избранного и корзин рецептов с фактическими'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сообщить о расхождениях, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        drifted = Recipe.objects.annotate(
+            actual_favorites=count_related(Favorite),
+            actual_carts=count_related(Cart)
+        ).filter(
+            ~Q(favorites_count=F('actual_favorites'))
+            | ~Q(in_carts_count=F('actual_carts'))
+        )
+        self.stdout.write(f'Расхождений: {drifted.count()}')
+        if options['check']:
+            return
+        Recipe.objects.filter(
+            id__in=drifted.values('id')
+        ).update(
+            favorites_count=count_related(Favorite),
+            in_carts_count=count_related(Cart)
+        )
+        self.stdout.write('Счётчики рецептов исправлены')
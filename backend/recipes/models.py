@@ -1,8 +1,13 @@
 from colorfield.fields import ColorField
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.transaction import atomic
+
+from users.models import Subscribe
 
 
 FoodgramUser = get_user_model()
@@ -60,6 +65,30 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def update_search_vector(self):
+        """Пересчитывает поисковый вектор рецептов одним UPDATE."""
+        if connections[self.db].vendor != 'postgresql':
+            return
+        ingredient_names = models.Subquery(
+            RecipeIngredient.objects.filter(
+                recipe=models.OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                names=StringAgg('ingredient__name', ' ')
+            ).values('names')
+        )
+        self.update(search_vector=(
+            SearchVector('name', weight='A', config=settings.SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=settings.SEARCH_CONFIG)
+            + SearchVector(
+                ingredient_names,
+                weight='C',
+                config=settings.SEARCH_CONFIG
+            )
+        ))
+
+
 class Recipe(models.Model):
     name = models.CharField(
         max_length=settings.RECIPE_NAME_MAX_LENGTH
@@ -83,6 +112,11 @@ class Recipe(models.Model):
         related_name='recipe',
     )
     image = models.ImageField(upload_to='media')
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        editable=False
+    )
     text = models.TextField(verbose_name='Описание')
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления',
@@ -96,10 +130,32 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        default=0
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         indexes = (
             models.Index(fields=('pub_date', )),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-pub_date'),
+                name='recipe_favorites_count_idx'
+            ),
         )
         ordering = ('-pub_date', )
         verbose_name = 'Рецепт'
@@ -177,3 +233,217 @@ class Cart(models.Model):
                 name='unique_shopping_cart'
             ),
         )
+
+
+class ShoppingListManager(models.Manager):
+
+    def recipe_amounts(self, recipe_id):
+        amounts = {}
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount'):
+            amounts[ingredient_id] = amounts.get(ingredient_id, 0) + amount
+        return amounts
+
+    @atomic
+    def change_amounts(self, user_ids, amounts):
+        """Прибавляет к спискам покупок пользователей количества amounts."""
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        user_ids = list(FoodgramUser.objects.select_for_update().filter(
+            id__in=user_ids
+        ).order_by('id').values_list('id', flat=True))
+        if not user_ids or not amounts:
+            return
+        items = {
+            (item.user_id, item.ingredient_id): item
+            for item in self.filter(
+                user_id__in=user_ids,
+                ingredient_id__in=amounts
+            )
+        }
+        created, updated, deleted = [], [], []
+        for user_id in user_ids:
+            for ingredient_id, amount in amounts.items():
+                item = items.get((user_id, ingredient_id))
+                if item is None:
+                    if amount > 0:
+                        created.append(self.model(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=amount
+                        ))
+                    continue
+                item.amount += amount
+                if item.amount > 0:
+                    updated.append(item)
+                else:
+                    deleted.append(item.id)
+        self.bulk_create(created)
+        self.bulk_update(updated, ('amount', ))
+        self.filter(id__in=deleted).delete()
+
+    def add_recipe(self, user_id, recipe_id):
+        self.change_amounts((user_id, ), self.recipe_amounts(recipe_id))
+
+    def remove_recipe(self, user_id, recipe_id):
+        self.change_amounts((user_id, ), {
+            ingredient_id: -amount for ingredient_id, amount
+            in self.recipe_amounts(recipe_id).items()
+        })
+
+    def update_recipe(self, recipe_id, old_amounts, new_amounts):
+        """Переносит изменение состава рецепта в корзины пользователей."""
+        amounts = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in {*old_amounts, *new_amounts}
+        }
+        self.change_amounts(
+            Cart.objects.filter(recipe_id=recipe_id).values_list(
+                'user_id', flat=True
+            ),
+            amounts
+        )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        FoodgramUser,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество'
+    )
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        default_related_name = 'shopping_list'
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
+class FeedManager(models.Manager):
+    """Ленты подписок: рецепты копируются в ленты при публикации."""
+
+    def is_popular(self, author_id):
+        return Subscribe.objects.filter(
+            author_id=author_id
+        ).count() >= settings.FEED_FANOUT_LIMIT
+
+    def popular_authors(self, user):
+        return Subscribe.objects.filter(user=user).annotate(
+            followers=models.Subquery(
+                Subscribe.objects.filter(
+                    author=models.OuterRef('author')
+                ).order_by().values('author').annotate(
+                    total=models.Count('id')
+                ).values('total')
+            )
+        ).filter(
+            followers__gte=settings.FEED_FANOUT_LIMIT
+        ).values('author_id')
+
+    def fan_out(self, recipe):
+        if self.is_popular(recipe.author_id):
+            return
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id,
+                    recipe=recipe,
+                    pub_date=recipe.pub_date
+                )
+                for user_id in Subscribe.objects.filter(
+                    author_id=recipe.author_id
+                ).values_list('user_id', flat=True)
+            ),
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+
+    def backfill(self, user_ids, author_id):
+        recipes = list(Recipe.objects.filter(
+            author_id=author_id
+        ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE])
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    pub_date=pub_date
+                )
+                for user_id in user_ids
+                for recipe_id, pub_date in recipes
+            ),
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+
+    def follow(self, user_id, author_id):
+        if not self.is_popular(author_id):
+            self.backfill((user_id, ), author_id)
+
+    def unfollow(self, user_id, author_id):
+        self.filter(user_id=user_id, recipe__author_id=author_id).delete()
+        followers = Subscribe.objects.filter(author_id=author_id)
+        if followers.count() == settings.FEED_FANOUT_LIMIT - 1:
+            self.backfill(
+                list(followers.values_list('user_id', flat=True)),
+                author_id
+            )
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        FoodgramUser,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта'
+    )
+
+    objects = FeedManager()
+
+    class Meta:
+        default_related_name = 'feed_entries'
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_entry_user_pub_date_idx'
+            ),
+        )
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver, Signal
+
+from recipes.models import FeedEntry, Recipe, ShoppingListItem
+from users.models import Subscribe
+
+# Отправляется после массовой загрузки справочника (bulk_create не
+# отправляет post_save), sender - модель справочника.
+reference_data_loaded = Signal()
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    ShoppingListItem.objects.update_recipe(
+        instance.id,
+        ShoppingListItem.objects.recipe_amounts(instance.id),
+        {}
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        FeedEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Subscribe)
+def fill_feed(sender, instance, created, **kwargs):
+    if created:
+        FeedEntry.objects.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def clear_feed(sender, instance, **kwargs):
+    FeedEntry.objects.unfollow(instance.user_id, instance.author_id)